@@ -2,6 +2,7 @@
 from typing import Optional, Any
 
 from .bot import AioTomon
+from .offload import blocking
 
 
 class Tomon(AioTomon):
@@ -11,7 +11,13 @@ class Api:
         pass
 
     def __getattr__(self, item: str) -> Callable[..., Union[Awaitable[Any], Any]]:
-        return functools.partial(self.call_action, item)
+        if item.startswith('__'):
+            raise AttributeError(item)
+        func = functools.partial(self.call_action, item)
+        if not item.startswith('_'):
+            # Cache the bound action, later lookups won't reach __getattr__
+            self.__dict__[item] = func
+        return func
 
 
 class AsyncApi(Api):
@@ -1,5 +1,5 @@
 
-from typing import Awaitable, Any, Dict, Optional
+from typing import Awaitable, Any, BinaryIO, Dict, Optional, Union
 
 
 class AsyncApi:
@@ -7,50 +7,63 @@ class AsyncApi:
     def send_text(
         self, *,
         cid: str,
-        content: str
-    ) -> Awaitable[Dict[str, Any]]:
+        content: str,
+        confirm: bool = False
+    ) -> Awaitable[Any]:
         '''
         发送频道文字消息
 
         :cid: 频道 ID ，应为字符串
         :content: 文字内容
+        :confirm: 可选，为 True 时返回 Delivery ，await 它得到网关回传的这条消息
         '''
         ...
 
     def send_image(
         self, *,
         cid: str,
-        file_path: str,
+        file_path: Optional[str] = None,
+        image: Optional[Union[bytes, bytearray, memoryview, BinaryIO]] = None,
+        filename: Optional[str] = None,
         content: str = '',
-        at_user: Optional[str] = None
-    ) -> Awaitable[Dict[str, Any]]:
+        at_user: Optional[str] = None,
+        confirm: bool = False
+    ) -> Awaitable[Any]:
         '''
-        发送频道图片消息
+        发送频道图片消息，图片类型（jpg/png/gif/webp/bmp）由文件头识别
 
         :cid: 频道 ID ，应为字符串
-        :file_path: 图片路径
+        :file_path: 图片路径，与 image 二选一
+        :image: 内存中的图片数据或可读取、可 seek 的二进制文件对象
+        :filename: 可选，上传的文件名，默认取路径中的文件名
         :content: 可选，附带文字内容
         :at_user: 可选，附带 at 的用户 id ，应为字符串
+        :confirm: 可选，为 True 时返回 Delivery ，await 它得到网关回传的这条消息
         '''
         ...
 
     def get_user_info(
-        self
+        self, *,
+        cache: bool = True
     ) -> Awaitable[Dict[str, Any]]:
         '''
         获取登录 bot 自身信息
+
+        :cache: 可选，优先从 STATE_CACHE 或 GET 缓存读取，False 则总是请求接口
         '''
         ...
 
     def get_channel_user_info(
         self, *,
         gid: str,
-        uid: str
+        uid: str,
+        cache: bool = True
     ) -> Awaitable[Dict[str, Any]]:
         '''
         获取某个群组的用户的个人信息
 
         :gid: 群组 id ，应为字符串
         :uid: 用户 id ，应为字符串
+        :cache: 可选，优先从 STATE_CACHE 或 GET 缓存读取，False 则总是请求接口
         '''
         ...
\ No newline at end of file
@@ -1,4 +1,7 @@
 
+from typing import NamedTuple, Optional, Tuple, FrozenSet
+
+
 class ChannelApi:
 
     login = 'login'
@@ -10,3 +13,25 @@ class ChannelApi:
     get_user_info = 'get_user_info'
 
     get_channel_user_info = 'get_channel_user_info'
+
+
+class Route(NamedTuple):
+    '''
+    Http route of an action
+
+    :method: 'GET' or 'POST'
+    :path: path template, e.g. '/channels/{channelId}/messages'
+    :path_params: pairs of (action param, template placeholder)
+    :required: params that must be present and not empty
+    :ttl: seconds a GET response is cached, None means the default ttl
+    '''
+
+    method: str
+
+    path: str
+
+    path_params: Tuple[Tuple[str, str], ...] = ()
+
+    required: FrozenSet[str] = frozenset()
+
+    ttl: Optional[float] = None
@@ -1,22 +1,42 @@
 
 
+import os
+import time
 import logging
 import functools
+import contextvars
 import aiohttp
 from aiohttp import FormData
-from typing import Any, Dict, Optional, Union
+from typing import Any, BinaryIO, Dict, Hashable, Optional, Tuple, Union, Callable, Awaitable, Iterable
 
 from .api import AsyncApi
-from .api_func import ChannelApi
-from .utils import FileIO, Validate
-from .config import Channel, Nonce as No
+from .api_func import ChannelApi, Route
+from .utils import FileIO, ImageCache, Validate
+from .ratelimit import RateLimiter
+from .codec import get_codec
+from .cache import TTLCache
+from .nonce import NonceTracker
+from .retry import RETRY_STATUSES, CircuitBreaker, RetryPolicy
+from .metrics import BotMetrics
+from .config import Channel
 from .message import MessageSegment as Ms
 from .exceptions import HttpFailed, NetworkError
 
-try:
-    import ujson as json
-except ImportError:
-    import json
+
+# An image in memory or a readable and seekable binary file object
+ImageSource = Union[bytes, bytearray, memoryview, BinaryIO]
+
+# The action whose requests are being sent, labels the http metrics
+_action: contextvars.ContextVar = contextvars.ContextVar('aiotomon_action', default='unknown')
+
+
+def _cache_key(action: str, params: Dict[str, Any]) -> Optional[Hashable]:
+    key = (action, tuple(sorted(params.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
 
 
 class HttpApi(AsyncApi):
@@ -26,7 +46,29 @@ class HttpApi(AsyncApi):
                  password: str, *,
                  timeout_sec: int,
                  token: Optional[str],
-                 user_info: Optional[Dict[str, Any]] = None):
+                 user_info: Optional[Dict[str, Any]] = None,
+                 conn_limit_per_host: int = 0,
+                 keepalive_timeout: float = 15,
+                 dns_cache_ttl: Optional[int] = 10,
+                 rate_limit_global: Optional[float] = None,
+                 rate_limit_route: Optional[float] = None,
+                 rate_limit_max_queue: int = 0,
+                 rate_limit_retries: int = 3,
+                 json_codec: Optional[str] = None,
+                 image_cache_size: int = 0,
+                 image_stream: bool = False,
+                 get_cache_size: int = 0,
+                 get_cache_ttl: float = 5,
+                 retry_attempts: int = 3,
+                 retry_backoff_base: float = 0.5,
+                 retry_backoff_cap: float = 8,
+                 retry_deadline: Optional[float] = None,
+                 retry_statuses: Iterable[int] = RETRY_STATUSES,
+                 circuit_breaker_threshold: int = 5,
+                 circuit_breaker_reset: float = 30,
+                 nonce_ttl: float = 60,
+                 nonce_max_size: int = 10000,
+                 metrics: Optional[BotMetrics] = None):
 
         self._api_root = api_root
         self._user_name = user_name
@@ -35,29 +77,129 @@ class HttpApi(AsyncApi):
         self._token = token
         self._user_info = user_info
 
+        self._conn_limit_per_host = conn_limit_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._dns_cache_ttl = dns_cache_ttl
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        self._limiter = RateLimiter(rate_limit_global, rate_limit_route,
+                                    max_queue=rate_limit_max_queue)
+        self._rate_limit_retries = rate_limit_retries
+
+        # All the attempts of a call share a deadline of 3 timeouts by default
+        if retry_deadline is None and timeout_sec:
+            retry_deadline = timeout_sec * 3
+        self._breaker = CircuitBreaker(circuit_breaker_threshold, circuit_breaker_reset)
+        self._retry = RetryPolicy(retry_attempts,
+                                  backoff_base=retry_backoff_base,
+                                  backoff_cap=retry_backoff_cap,
+                                  deadline=retry_deadline,
+                                  statuses=retry_statuses,
+                                  breaker=self._breaker,
+                                  log=logging.getLogger(__name__))
+
+        self._codec = get_codec(json_codec)
+
+        self._image_cache = ImageCache(image_cache_size) if image_cache_size else None
+        self._image_stream = image_stream
+
+        self._get_cache = TTLCache(get_cache_size) if get_cache_size else None
+        self._get_cache_ttl = get_cache_ttl
+        self._metrics = metrics
+        self._nonces = NonceTracker(nonce_ttl, nonce_max_size, metrics)
+
+        self._routes: Dict[str, Route] = {}
+        self._actions: Dict[str, Callable[..., Awaitable[Any]]] = {}
+        self._register_default_routes()
+
         logging.basicConfig(level=logging.INFO,
                             format='%(asctime)s - %(levelname)s - %(message)s',
                             datefmt='%Y-%m-%d %H:%M:%S')
         self._log = logging.getLogger(__name__)
 
-    async def call_action(self, action: str, **kwargs) -> Any:
+    def _register_default_routes(self) -> None:
+        self.register_action(ChannelApi.login, self._action_login)
+        # POST
+        self.register_action(ChannelApi.send_image, self._action_send_image)
+        self.register_route(ChannelApi.send_text, 'POST', Channel.SEND_TEXT,
+                            path_params={'cid': 'channelId'})
+        # GET
+        self.register_route(ChannelApi.get_user_info, 'GET', Channel.GET_USER_INFO)
+        self.register_route(ChannelApi.get_channel_user_info, 'GET',
+                            Channel.GET_CHANNEL_USER_INFO,
+                            path_params={'gid': 'guildId', 'uid': 'userId'})
 
-        mapping = {
-            ChannelApi.login: self._action_login,
-            # POST
-            ChannelApi.send_image: self._action_send_image,
-            ChannelApi.send_text: self._post(Channel.SEND_TEXT.format(channelId=kwargs.get('cid'))),
-            # GET
-            ChannelApi.get_user_info: self._get(Channel.GET_USER_INFO),
-            ChannelApi.get_channel_user_info: self._get(Channel.GET_CHANNEL_USER_INFO.format(guildId=kwargs.get('gid'), userId=kwargs.get('uid')))
-        }
+    def register_action(self, action: str,
+                        func: Callable[..., Awaitable[Any]]) -> None:
+        '''
+        Register a custom coroutine function as the handler of an action
+        '''
+        self._actions[action] = func
+
+    def register_route(self, action: str, method: str, path: str, *,
+                       path_params: Optional[Dict[str, str]] = None,
+                       required: Iterable[str] = (),
+                       ttl: Optional[float] = None) -> Route:
+        '''
+        Register a plain json action, path params are always required
+
+        :path_params: mapping of action param -> path template placeholder
+        :ttl: seconds a GET response is cached, None means GET_CACHE_TTL
+        '''
+        path_params = tuple((path_params or {}).items())
+        route = Route(method=method.upper(),
+                      path=path,
+                      path_params=path_params,
+                      required=frozenset(required) | {k for k, _ in path_params},
+                      ttl=ttl)
+        self._routes[action] = route
+        self._actions[action] = functools.partial(self._call_route, action, route)
+        return route
 
+    async def call_action(self, action: str, confirm: bool = False, **kwargs) -> Any:
+        '''
+        :confirm: return a `Delivery` of the sent message instead, which
+                  resolves to the message echoed by the gateway
+        '''
+        if confirm:
+            nonce = kwargs['nonce'] = kwargs.get('nonce') or self._nonces.issue()
+            delivery = self._nonces.track(nonce)
+            delivery.response = await self.call_action(action, **kwargs)
+            return delivery
+
+        # Requests are recorded when sent, cache hits never reach `_send`
+        token = _action.set(action) if self._metrics is not None else None
         try:
-            return await mapping[action](**kwargs)
+            return await self._actions[action](**kwargs)
         except aiohttp.InvalidURL:
             raise NetworkError('Api parsing error, please check the root URL')
         except aiohttp.ClientError:
             raise NetworkError('aiohttp connection error')
+        finally:
+            if token is not None:
+                _action.reset(token)
+
+    async def _call_route(self, action: str, route: Route, cache: bool = True,
+                          **params) -> Optional[Dict[str, Any]]:
+        '''
+        :cache: whether a GET may be answered by the cache, never sent
+        '''
+        if not Validate.action(route.required, params):
+            return None
+        key = None
+        if cache and route.method == 'GET' and self._get_cache is not None:
+            key = _cache_key(action, params)
+        url_path = route.path
+        if route.path_params:
+            url_path = url_path.format(
+                **{placeholder: params.pop(k) for k, placeholder in route.path_params})
+        if route.method != 'GET':
+            return await self._action_general(url_path, **params)
+        if key is None:
+            return await self._get_data(url_path, **params)
+        ttl = self._get_cache_ttl if route.ttl is None else route.ttl
+        return await self._get_cache.get(
+            key, functools.partial(self._get_data, url_path, **params), ttl)
 
     async def _action_login(self, **params) -> Dict[str, Any]:
 
@@ -75,27 +217,139 @@ class HttpApi(AsyncApi):
         return self._user_info
 
     async def _action_send_image(self, **params) -> Union[Dict[str, Any], None]:
-        if not Validate.action({'cid', 'file_path'}, params):
+        if not Validate.action({'cid'}, params) or \
+                (params.get('file_path') in (None, '') and params.get('image') is None):
             return None
 
-        async def _post_file_image(self, file_path: str,
-                                   cid: str,
+        async def _post_file_image(self, cid: str,
+                                   file_path: Optional[str] = None,
+                                   image: Optional[ImageSource] = None,
+                                   filename: Optional[str] = None,
                                    content: str = '',
-                                   at_user: Optional[str] = None) -> Dict[str, Any]:
+                                   at_user: Optional[str] = None,
+                                   nonce: Optional[str] = None) -> Dict[str, Any]:
             url_path = Channel.SEND_IMAGE.format(channelId=cid)
-            file_info = FileIO.get_file_info(file_path)
-            data = FormData()
-            data.add_field('files', await FileIO.read_image(file_path),
-                           content_type=file_info['content_type'],
-                           filename=file_info['name'])
-            payload_json = {'nonce': No.IDENT,
+            name, content_type, body = await self._image_body(file_path, image, filename)
+            payload_json = {'nonce': nonce or self._nonces.issue(),
                             'content': Ms.at(at_user) + content if at_user else content}
-            data.add_field('payload_json', json.dumps(payload_json))
+            payload_json = self._codec.dumps(payload_json)
+
+            def form_data() -> FormData:
+                # FormData can only be sent once, so build one per attempt
+                data = FormData()
+                data.add_field('files', body(),
+                               content_type=content_type,
+                               filename=name)
+                data.add_field('payload_json', payload_json)
+                return data
 
-            return await self._post_data(url_path, data=data)
+            return await self._post_data(url_path, data_factory=form_data,
+                                         idempotent=True)
 
         return await _post_file_image(self, **params)
 
+    async def _image_body(self, file_path: Optional[str],
+                          image: Optional[ImageSource],
+                          filename: Optional[str]) -> Tuple[str, str, Callable[[], Any]]:
+        '''
+        (file name, content type, factory of the upload body) of an image
+
+        In-memory images are sent as they are, file-like objects and
+        streamed files are read chunk by chunk on every attempt
+        '''
+        if image is None:
+            if self._image_cache is not None:
+                image = await self._image_cache.read(file_path)
+            elif self._image_stream:
+                head = await FileIO.read_head(file_path)
+                info = FileIO.get_file_info(file_path, head)
+                return (filename or info['name'], info['content_type'],
+                        functools.partial(FileIO.stream, file_path))
+            else:
+                image = await FileIO.read_image(file_path)
+
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            suffix, content_type = FileIO.image_type(bytes(image[:FileIO.HEAD_SIZE]))
+            data = image
+
+            def factory() -> Any:
+                return data
+        else:
+            offset = image.tell()
+            head = image.read(FileIO.HEAD_SIZE)
+            image.seek(offset)
+            suffix, content_type = FileIO.image_type(head)
+            factory = functools.partial(FileIO.stream_fileobj, image, offset)
+
+        if file_path:
+            filename = filename or os.path.basename(file_path)
+        return filename or f'image.{suffix}', content_type, factory
+
+    async def prepare(self, action: str, **params) -> Dict[str, Any]:
+        '''
+        Resolve the parts of `params` shared by many calls of `action` once,
+        the image of send_image is read into memory and its type checked
+        '''
+        if action != ChannelApi.send_image:
+            return params
+        file_path = params.pop('file_path', None)
+        image = params.pop('image', None)
+        if image is None and file_path:
+            if self._image_cache is not None:
+                image = await self._image_cache.read(file_path)
+            else:
+                image = await FileIO.read_image(file_path)
+            params['filename'] = params.get('filename') or os.path.basename(file_path)
+        elif image is not None and not isinstance(image, (bytes, bytearray, memoryview)):
+            offset = image.tell()
+            image = b''.join([chunk async for chunk in FileIO.stream_fileobj(image, offset)])
+        if image is not None:
+            FileIO.image_type(bytes(image[:FileIO.HEAD_SIZE]))
+            params['image'] = image
+        return params
+
+    def invalidate(self, action: Optional[str] = None, **params) -> None:
+        '''
+        Drop cached GET responses: of `action` called with exactly `params`,
+        of every call of `action` without params, or all without an action
+        '''
+        if self._get_cache is None:
+            return
+        if action is None:
+            self._get_cache.clear()
+        elif params:
+            key = _cache_key(action, params)
+            if key is not None:
+                self._get_cache.invalidate(key)
+        else:
+            self._get_cache.invalidate_where(lambda key: key[0] == action)
+
+    @property
+    def get_cache_stats(self) -> Optional[Dict[str, int]]:
+        return self._get_cache.stats if self._get_cache is not None else None
+
+    @property
+    def image_cache_stats(self) -> Optional[Dict[str, int]]:
+        return self._image_cache.stats if self._image_cache is not None else None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        '''
+        Lazily create the long-lived session, connections are pooled and reused
+        '''
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self._conn_limit_per_host,
+                keepalive_timeout=self._keepalive_timeout,
+                ttl_dns_cache=self._dns_cache_ttl,
+                use_dns_cache=self._dns_cache_ttl is not None)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
     @property
     def _header(self):
         headers = {}
@@ -103,41 +357,108 @@ class HttpApi(AsyncApi):
             headers['Authorization'] = 'Bearer ' + self._token
             return headers
 
+    async def _request(self, method: str, url_path: str, *,
+                       json: Optional[Any] = None,
+                       data_factory: Optional[Callable[[], Any]] = None,
+                       idempotent: Optional[bool] = None,
+                       **kwargs) -> Dict[str, Any]:
+        '''
+        Send a request through the rate limiter, a 429 response is queued again
+        after the server's Retry-After instead of failing at once. Transient
+        failures are retried by the retry policy
+
+        :json: encoded to bytes once by the configured codec
+        :data_factory: build a fresh request body for every attempt
+        :idempotent: whether sending it twice is harmless, GETs by default
+        '''
+        headers = dict(self._header or {})
+        if json is not None:
+            kwargs['data'] = self._codec.dumpb(json)
+            headers['Content-Type'] = 'application/json'
+        if idempotent is None:
+            idempotent = method == 'GET'
+
+        async def attempt(timeout: Optional[float]) -> Dict[str, Any]:
+            return await self._send(method, url_path, headers, data_factory,
+                                    timeout, **kwargs)
+
+        return await self._retry.run(url_path, attempt, idempotent, self._timeout_sec)
+
+    async def _send(self, method: str, url_path: str, headers: Dict[str, str],
+                    data_factory: Optional[Callable[[], Any]],
+                    timeout: Optional[float], **kwargs) -> Dict[str, Any]:
+        session = self._get_session()
+        attempt = 0
+        while True:
+            await self._limiter.acquire(url_path)
+            if data_factory is not None:
+                kwargs['data'] = data_factory()
+            begin = time.perf_counter()
+            status = 'error'
+            try:
+                async with session.request(method, self._api_root + url_path,
+                                           headers=(headers or None),
+                                           timeout=aiohttp.ClientTimeout(total=timeout),
+                                           **kwargs) as res:
+                    self._limiter.update(url_path, res.status, res.headers)
+                    if 200 <= res.status < 300:
+                        body = await res.read()
+                        status = '2xx'
+                        return self._codec.loads(body) if body else None
+                    status = str(res.status)
+                    if res.status != 429:
+                        raise HttpFailed(res.status)
+            finally:
+                if self._metrics is not None:
+                    self._metrics.observe_http(_action.get(), status,
+                                               time.perf_counter() - begin)
+            attempt += 1
+            if attempt > self._rate_limit_retries:
+                self._limiter.reject()
+                raise HttpFailed(429)
+            self._log.warning(f'{url_path} 触发频率限制，第 {attempt} 次排队重试')
+
+    def set_rate_limiter(self, limiter: Any) -> None:
+        '''
+        Replace the rate limiter, e.g. by one shared among processes
+        '''
+        self._limiter = limiter
+
+    @property
+    def rate_limit_stats(self) -> Dict[str, int]:
+        return self._limiter.stats
+
+    @property
+    def nonces(self) -> NonceTracker:
+        return self._nonces
+
+    @property
+    def retry_stats(self) -> Dict[str, Any]:
+        return self._retry.stats
+
     async def _post_data(self, url_path: str, *,
                          data: Optional[Any] = None,
-                         json: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self._api_root + url_path,
-                                    data=data,
-                                    json=json, headers=(self._header or None),
-                                    timeout=self._timeout_sec) as res:
-                if 200 <= res.status < 300:
-                    return await res.json()
-                raise HttpFailed(res.status)
+                         json: Optional[Dict[str, Any]] = None,
+                         data_factory: Optional[Callable[[], Any]] = None,
+                         idempotent: bool = False) -> Dict[str, Any]:
+        '''
+        :idempotent: the body carries a unique nonce, a retry can't send twice
+        '''
+        if data_factory is not None:
+            return await self._request('POST', url_path, data_factory=data_factory,
+                                       idempotent=idempotent)
+        if json is not None:
+            return await self._request('POST', url_path, json=json, idempotent=idempotent)
+        return await self._request('POST', url_path, data=data, idempotent=idempotent)
 
     async def _action_general(self, url_path: str, **params) -> Dict[str, Any]:
         '''
         POST: General json format parameters
         '''
         # params.pop('cid')  # Extra parameters don’t matter
-        params['nonce'] = No.IDENT
-        return await self._post_data(url_path, json=params)
-
-    def _post(self, url_path: str) -> Any:
-        '''
-        Magic method of matching mapping
-        '''
-        return functools.partial(self._action_general, url_path)
+        if 'nonce' not in params:
+            params['nonce'] = self._nonces.issue()
+        return await self._request('POST', url_path, json=params, idempotent=True)
 
     async def _get_data(self, url_path: str, **params) -> Dict[str, Any]:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(self._api_root + url_path,
-                                   params=params,
-                                   headers=(self._header or None),
-                                   timeout=self._timeout_sec) as res:
-                if 200 <= res.status < 300:
-                    return await res.json()
-                raise HttpFailed(res.status)
-
-    def _get(self, url_path: str) -> Any:
-        return functools.partial(self._get_data, url_path)
+        return await self._request('GET', url_path, params=params)
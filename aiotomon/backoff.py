@@ -0,0 +1,29 @@
+
+import random
+
+
+class Backoff:
+    '''
+    Exponential backoff with full jitter: the n-th delay is a random
+    value in [0, min(cap, base * 2 ** n)]
+    '''
+
+    __slots__ = ('_base', '_cap', '_attempt')
+
+    def __init__(self, base: float = 0.5, cap: float = 60):
+        self._base = base
+        self._cap = cap
+        self._attempt = 0
+
+    def next(self) -> float:
+        delay = min(self._cap, self._base * 2 ** self._attempt)
+        if delay < self._cap:
+            self._attempt += 1
+        return random.uniform(0, delay)
+
+    def reset(self) -> None:
+        self._attempt = 0
+
+    @property
+    def attempt(self) -> int:
+        return self._attempt
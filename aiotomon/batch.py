@@ -0,0 +1,100 @@
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class _Batch:
+
+    __slots__ = ('contents', 'futures', 'length', 'timer')
+
+    def __init__(self):
+        self.contents: List[str] = []
+        self.futures: List[asyncio.Future] = []
+        self.length = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class TextBatcher:
+    '''
+    Coalesce texts sent to the same channel within `window` seconds into one
+    message, batches of a channel are delivered in order
+
+    :send: coroutine function of (cid, content) which really sends the text
+    :window: seconds to wait for more texts after the first one
+    :max_length: a batch is flushed early before exceeding this length
+    :separator: joins the texts of a batch
+    '''
+
+    def __init__(self, send: Callable[[str, str], Awaitable[Any]], *,
+                 window: float,
+                 max_length: int = 2000,
+                 separator: str = '\n'):
+        self._send = send
+        self._window = window
+        self._max_length = max_length
+        self._separator = separator
+        self._pending: Dict[str, _Batch] = {}
+        self._tails: Dict[str, asyncio.Task] = {}
+
+    async def send(self, cid: str, content: str) -> Any:
+        '''
+        Resolve with the api result of the message containing `content`
+        '''
+        batch = self._pending.get(cid)
+        if batch is not None and \
+                batch.length + len(self._separator) + len(content) > self._max_length:
+            self._flush(cid)
+            batch = None
+
+        if batch is None:
+            batch = self._pending[cid] = _Batch()
+            batch.timer = asyncio.get_event_loop().call_later(
+                self._window, self._flush, cid)
+        else:
+            batch.length += len(self._separator)
+
+        future = asyncio.get_event_loop().create_future()
+        batch.contents.append(content)
+        batch.futures.append(future)
+        batch.length += len(content)
+
+        if batch.length >= self._max_length:
+            self._flush(cid)
+
+        return await future
+
+    def _flush(self, cid: str) -> None:
+        batch = self._pending.pop(cid, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        previous = self._tails.get(cid)
+        self._tails[cid] = asyncio.ensure_future(
+            self._deliver(cid, batch, previous))
+
+    async def _deliver(self, cid: str, batch: _Batch,
+                       previous: Optional[asyncio.Task]) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            result = await self._send(cid, self._separator.join(batch.contents))
+        except Exception as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            if self._tails.get(cid) is asyncio.current_task():
+                del self._tails[cid]
+
+    async def close(self) -> None:
+        '''
+        Deliver all pending texts
+        '''
+        for cid in list(self._pending):
+            self._flush(cid)
+        if self._tails:
+            await asyncio.wait(list(self._tails.values()))
@@ -1,24 +1,35 @@
 
+import time
 import logging
 import asyncio
-from typing import Any, Dict, Optional, Callable, Awaitable, Union
+import inspect
+from typing import Any, Dict, Optional, Callable, Awaitable, Union, Iterable, Set, Tuple
 
 from .api import AsyncApi
 from .api_impl import HttpApi
+from .api_func import ChannelApi
 from .event import Event, EventQueue, run_async_funcs
-from .config import Op, E, O
+from .config import Op, E, O, MEMBER_EVENTS
 from .plugin import Plugins
-from .message import identify, to_message
+from .batch import TextBatcher
+from .dispatch import Dispatcher
+from .codec import get_codec
+from .transport import Compression, GatewayStats, ZlibStream, connect_options, counts_wire
+from .heartbeat import Heartbeat
+from .backoff import Backoff
+from .shard import shard_of
+from .offload import Offloader
+from .monitor import HandlerProfiler, LoopMonitor, func_label
+from .metrics import BotMetrics, MetricsServer, Registry
+from .broadcast import BroadcastReport, fan_out
+from .state import State
+from .nonce import is_own
+from .message import Classifier, Rule, to_message
 from .exceptions import ResponseError, NetworkError, OperationError
 
 import websockets as ws
 from websockets import ConnectionClosed
 
-try:
-    import ujson as json
-except ImportError:
-    import json
-
 
 class AioTomon(AsyncApi):
 
@@ -30,33 +41,266 @@ class AioTomon(AsyncApi):
                  password: str = '',
                  timeout_sec: int = 10,
                  plugins_dir: str = 'plugins',
-                 token: Optional[str] = None):
+                 token: Optional[str] = None,
+                 conn_limit_per_host: int = 0,
+                 keepalive_timeout: float = 15,
+                 dns_cache_ttl: Optional[int] = 10,
+                 rate_limit_global: Optional[float] = None,
+                 rate_limit_route: Optional[float] = None,
+                 rate_limit_max_queue: int = 0,
+                 rate_limit_retries: int = 3,
+                 send_text_batch_window: Optional[float] = None,
+                 send_text_batch_max_length: int = 2000,
+                 dispatch_workers: int = 16,
+                 dispatch_queue_size: int = 1000,
+                 dispatch_overflow: str = 'block',
+                 dispatch_drop_events: Iterable[str] = ('USER_TYPING', 'USER_PRESENCE_UPDATE'),
+                 dispatch_drain_timeout: float = 5,
+                 dispatch_ordered: bool = False,
+                 dispatch_order_key: Optional[Callable[[Any], Any]] = None,
+                 json_codec: Optional[str] = None,
+                 gateway_compression: Optional[str] = None,
+                 gateway_deflate_window_bits: Optional[int] = None,
+                 gateway_deflate_mem_level: Optional[int] = None,
+                 heartbeat_interval: float = 10,
+                 heartbeat_max_missed: int = 2,
+                 reconnect_backoff_base: float = 0.5,
+                 reconnect_backoff_cap: float = 60,
+                 gateway_resume: bool = False,
+                 server_uri: Optional[str] = None,
+                 api_root: Optional[str] = None,
+                 offload_threads: Optional[int] = None,
+                 offload_processes: Optional[int] = None,
+                 profile_handlers: bool = True,
+                 slow_handler_threshold: float = 1.0,
+                 loop_monitor_interval: float = 0.5,
+                 loop_stall_threshold: float = 0.5,
+                 loop_stall_profile: bool = False,
+                 metrics: bool = False,
+                 metrics_host: str = '127.0.0.1',
+                 metrics_port: Optional[int] = None,
+                 image_cache_size: int = 0,
+                 image_stream: bool = False,
+                 broadcast_concurrency: int = 10,
+                 state_cache: bool = True,
+                 state_max_users: Optional[int] = 10000,
+                 state_max_members: Optional[int] = 50000,
+                 state_max_channels: Optional[int] = 10000,
+                 state_max_roles: Optional[int] = 10000,
+                 state_max_guilds: Optional[int] = 1000,
+                 get_cache_size: int = 1024,
+                 get_cache_ttl: float = 5,
+                 retry_attempts: int = 3,
+                 retry_backoff_base: float = 0.5,
+                 retry_backoff_cap: float = 8,
+                 retry_deadline: Optional[float] = None,
+                 retry_statuses: Iterable[int] = (500, 502, 503, 504),
+                 circuit_breaker_threshold: int = 5,
+                 circuit_breaker_reset: float = 30,
+                 nonce_ttl: float = 60,
+                 nonce_max_size: int = 10000,
+                 startup_hook_timeout: Optional[float] = 30,
+                 preload_lazy_plugins: bool = True):
 
         self._ws = None
+        self._recv_bytes = False
+        self._codec = get_codec(json_codec)
+        self._compression = gateway_compression
+        self._gateway_stats = GatewayStats()
+        self._server_uri, self._connect_options = connect_options(
+            server_uri or self.SERVER_URI, gateway_compression,
+            window_bits=gateway_deflate_window_bits,
+            mem_level=gateway_deflate_mem_level,
+            stats=self._gateway_stats)
+        self._zlib_stream: Optional[ZlibStream] = None
+        # Whether the deflate extension counts the wire bytes itself
+        self._counts_wire = False
+        # Overridden by the interval of the HELLO payload
+        self._default_heartbeat_interval = heartbeat_interval
+        self._heartbeat_interval = heartbeat_interval
+        self._heartbeat = Heartbeat(self._send_heartbeat, self._on_zombie,
+                                    max_missed=heartbeat_max_missed)
+
+        self._backoff = Backoff(reconnect_backoff_base, reconnect_backoff_cap)
+        self._backoff_reset_after = reconnect_backoff_cap
+        self._connected_at: Optional[float] = None
+        self._reconnects = 0
+        self._resume = gateway_resume
+        self._session_id: Optional[str] = None
+        self._seq: Optional[int] = None
+        # Whether the gateway resumed the session on the last IDENTIFY
+        self._resumed = False
+
+        self._shard: Optional[Tuple[int, int]] = None
+
+        # A metrics port enables the metrics as well
+        self._metrics: Optional[BotMetrics] = None
+        self._metrics_server: Optional[MetricsServer] = None
+        if metrics or metrics_port is not None:
+            self._metrics = BotMetrics()
+
+        self._offloader = Offloader(offload_threads, offload_processes)
+        # Sync func -> the coroutine function running it offloaded
+        self._offloaded: Dict[Callable, Callable[..., Awaitable[Any]]] = {}
         self._api = None
         self._bot_info = None
         self._bot_start_before = set()
         self._ws_start_before = set()
         self._send_before = set()
+        self._startup_hook_timeout = startup_hook_timeout
+        # Hooks registered after their life cycle ran, e.g. by a lazy plugin,
+        # run at once
+        self._started = False
+        self._ws_started = False
+        self._late_hooks: Set[asyncio.Future] = set()
+        self._preload_lazy_plugins = preload_lazy_plugins
+        self._preload: Optional[asyncio.Future] = None
 
         self._queue = EventQueue()
+        self._classifier = Classifier()
+        # Gateway event type -> whether anyone listens to it
+        self._wanted: Dict[Optional[str], bool] = {}
+        self._wanted_version = self._queue.version
+        self._unsubscribed_frames = 0
         self._plugin = Plugins(plugins_dir)
 
         self._configure(
-            api_root=self.API_ROOT,
+            api_root=api_root or self.API_ROOT,
             user_name=user_name,
             password=password,
             timeout_sec=timeout_sec,
-            token=token
+            token=token,
+            conn_limit_per_host=conn_limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            dns_cache_ttl=dns_cache_ttl,
+            rate_limit_global=rate_limit_global,
+            rate_limit_route=rate_limit_route,
+            rate_limit_max_queue=rate_limit_max_queue,
+            rate_limit_retries=rate_limit_retries,
+            json_codec=json_codec,
+            image_cache_size=image_cache_size,
+            image_stream=image_stream,
+            get_cache_size=get_cache_size,
+            get_cache_ttl=get_cache_ttl,
+            retry_attempts=retry_attempts,
+            retry_backoff_base=retry_backoff_base,
+            retry_backoff_cap=retry_backoff_cap,
+            retry_deadline=retry_deadline,
+            retry_statuses=retry_statuses,
+            circuit_breaker_threshold=circuit_breaker_threshold,
+            circuit_breaker_reset=circuit_breaker_reset,
+            nonce_ttl=nonce_ttl,
+            nonce_max_size=nonce_max_size,
+            metrics=self._metrics
         )
 
+        self._dispatcher = Dispatcher(self._handle_ws_event_response,
+                                      workers=dispatch_workers,
+                                      queue_size=dispatch_queue_size,
+                                      overflow=dispatch_overflow,
+                                      drop_events=dispatch_drop_events,
+                                      ordered=dispatch_ordered,
+                                      key=dispatch_order_key,
+                                      metrics=self._metrics,
+                                      log=self.log)
+        self._dispatch_drain_timeout = dispatch_drain_timeout
+
+        self._profiler: Optional[HandlerProfiler] = None
+        if profile_handlers:
+            self._profiler = HandlerProfiler(slow_handler_threshold,
+                                             owner=self._plugin.owner,
+                                             log=self.log)
+            self._queue.profiler = self._profiler
+        self._loop_monitor = LoopMonitor(loop_monitor_interval, loop_stall_threshold,
+                                         profile=loop_stall_profile, log=self.log)
+
+        if self._metrics is not None:
+            self._register_metrics(self._metrics.registry)
+            if metrics_port is not None:
+                self._metrics_server = MetricsServer(self._metrics.registry,
+                                                     metrics_host, metrics_port,
+                                                     log=self.log)
+
+        self._broadcast_concurrency = broadcast_concurrency
+
+        self._state: Optional[State] = None
+        if state_cache:
+            self._state = State(state_max_users, state_max_members, state_max_channels,
+                                state_max_roles, state_max_guilds)
+            self._state.install(self._api)
+
+        self._batcher = None
+        if send_text_batch_window:
+            self._batcher = TextBatcher(self._send_text_batch,
+                                        window=send_text_batch_window,
+                                        max_length=send_text_batch_max_length)
+
     def _configure(self, api_root: str,
                    user_name: str,
                    password: str,
                    timeout_sec: Optional[int],
-                   token: Optional[str]) -> None:
+                   token: Optional[str],
+                   **options) -> None:
+        '''
+        :options: connection pool and rate limit options of HttpApi
+        '''
         self._api = HttpApi(api_root, user_name, password,
-                            timeout_sec=timeout_sec, token=token)
+                            timeout_sec=timeout_sec, token=token,
+                            **options)
+
+    def _register_metrics(self, registry: Registry) -> None:
+        '''
+        Counters kept by the bot itself are read when scraped
+        '''
+        registry.callback('reconnects_total', 'Gateway reconnects',
+                          lambda: self._reconnects, kind='counter')
+        registry.callback('heartbeat_rtt_seconds', 'Last heartbeat round trip time',
+                          lambda: self._heartbeat.last_rtt)
+        registry.callback('heartbeat_latency_seconds', 'Rolling average heartbeat RTT',
+                          lambda: self._heartbeat.latency)
+        registry.callback('gateway_bytes_total', 'Gateway bytes received',
+                          lambda: {('wire',): self._gateway_stats.bytes_in,
+                                   ('decoded',): self._gateway_stats.bytes_decoded},
+                          ('stage',), kind='counter')
+        registry.callback('dispatch_queue_depth', 'Events waiting for a worker',
+                          lambda: self._dispatcher.queue_depth)
+        registry.callback('dispatch_dropped_total', 'Events dropped on overflow',
+                          lambda: self._dispatcher.stats['dropped'], kind='counter')
+        registry.callback('unsubscribed_frames_total',
+                          'Gateway events dropped because nobody subscribes to them',
+                          lambda: self._unsubscribed_frames, kind='counter')
+        registry.callback('cache_hits_total', 'Api calls answered without a request',
+                          self._cache_hits, ('cache',), kind='counter')
+        registry.callback('rate_limit_queued', 'Requests waiting for a token',
+                          lambda: self._api.rate_limit_stats['queued'])
+        registry.callback('rate_limit_rejected_total', 'Requests rejected by the rate limiter',
+                          lambda: self._api.rate_limit_stats['rejected'], kind='counter')
+        registry.callback('loop_lag_seconds', 'Last measured event loop lag',
+                          lambda: self._loop_monitor.stats['lag'])
+
+    def _cache_hits(self) -> Dict[Tuple[str, ...], int]:
+        hits = {}
+        get_cache = self._api.get_cache_stats
+        if get_cache is not None:
+            # A call sharing an in-flight request makes no request either
+            hits[('get',)] = get_cache['hits'] + get_cache['coalesced']
+        if self._state is not None:
+            hits[('state',)] = self._state.stats['hits']
+        return hits
+
+    @property
+    def state(self) -> Optional[State]:
+        '''
+        The entity cache fed by the gateway events, None unless STATE_CACHE
+        '''
+        return self._state
+
+    @property
+    def metrics(self) -> Optional[Registry]:
+        '''
+        The metrics registry, None unless METRICS or METRICS_PORT is set
+        '''
+        return self._metrics.registry if self._metrics else None
 
     @property
     def log(self) -> logging.Logger:
@@ -66,17 +310,59 @@ class AioTomon(AsyncApi):
         await self.login()
 
     async def _single_recv(self, verif_code: int) -> Dict[str, Any]:
-        resp = json.loads(await self._ws.recv())
+        resp = self._codec.loads(await self._recv())
         if resp['op'] != verif_code:
             raise ResponseError
         return resp
 
+    async def _recv(self) -> Union[str, bytes]:
+        '''
+        Text frames are received as raw bytes when websockets supports it,
+        the codec decodes them without building a str first
+        '''
+        stats = self._gateway_stats
+        if self._zlib_stream is not None:
+            while True:
+                data = await self._ws.recv()
+                stats.bytes_in += len(data)
+                if isinstance(data, str):
+                    break
+                data = self._zlib_stream.feed(data)
+                if data is not None:
+                    break
+        else:
+            if self._recv_bytes:
+                data = await self._ws.recv(decode=False)
+            else:
+                data = await self._ws.recv()
+            if not self._counts_wire:
+                stats.bytes_in += len(data)
+        stats.frames += 1
+        stats.bytes_decoded += len(data)
+        return data
+
     async def _verif(self) -> None:
         auth = {'op': Op.IDENTIFY, 'd': {'token': self._api._token}}
-        await self._ws.send(json.dumps(auth))
+        resuming = self._resume and self._session_id and self._seq is not None
+        if resuming:
+            # Ask the gateway to replay the events after `seq`
+            auth['d']['session_id'] = self._session_id
+            auth['d']['seq'] = self._seq
+            self.log.info(f'尝试恢复会话，从序号 {self._seq} 开始补发事件')
+        if self._shard:
+            auth['d']['shard'] = list(self._shard)
+        await self._ws.send(self._codec.dumps(auth))
         resp = await self._single_recv(Op.IDENTIFY)
         self._bot_info = resp['d']
 
+        d = resp['d']
+        session_id = d.get('session_id') if isinstance(d, dict) else None
+        self._resumed = bool(resuming) and session_id == self._session_id
+        if not self._resumed:
+            # A new session, the sequence starts over
+            self._session_id = session_id
+            self._seq = None
+
     async def _success(self) -> None:
         if not self._api._user_info:
             self._api._user_info = await self.get_user_info()
@@ -87,9 +373,13 @@ class AioTomon(AsyncApi):
 
     async def _initial(self) -> None:
         self.log.info('尝试与服务器通信...')
-        await self._single_recv(Op.HELLO)
+        hello = await self._single_recv(Op.HELLO)
         self.log.info('已与服务器建立连接')
 
+        interval = (hello.get('d') or {}).get('heartbeat_interval')
+        self._heartbeat_interval = interval / 1000 if interval \
+            else self._default_heartbeat_interval
+
         if not self._api._token:
             self.log.info('正在请求 Token 令牌...')
             await self._get_token()
@@ -105,9 +395,14 @@ class AioTomon(AsyncApi):
         '''
         Life cycle 2: loading plugins
         '''
+        # Fail at startup rather than on the first event
+        self._offloader.check()
         plugins = self._plugin.plugins_info
         for plugin in plugins:
             self.log.info(f'Life cycle [ on_load_plugin ]: {plugin} Loaded')
+        for plugin, events in self._plugin.lazy_plugins.items():
+            self.log.info(f'Life cycle [ on_load_plugin ]: {plugin} Deferred '
+                          f'until {", ".join(events)}')
 
     async def _connect(self) -> None:
 
@@ -115,71 +410,250 @@ class AioTomon(AsyncApi):
 
         await self._on_load_plugins()
 
+        # The queue and the workers outlive the connections, the handlers
+        # only need http so the queued events are handled while reconnecting
+        self._dispatcher.start()
+        self._loop_monitor.start()
+        if self._metrics_server is not None:
+            await self._metrics_server.start()
+
         self.log.info('正在开启 ws 连接...')
 
         while True:
             try:
                 await self._ws_connect()
-            except ConnectionResetError as e:
-                self.log.error(e)
-                self.log.warning('连接远程服务器失败，3 秒后尝试重连...')
-                await asyncio.sleep(3)
+            except OSError as e:
+                self.log.error(f'连接远程服务器失败：{e!r}')
 
+            # A connection which stayed up for a while starts the backoff over
+            if self._connected_at is not None and \
+                    time.monotonic() - self._connected_at > self._backoff_reset_after:
+                self._backoff.reset()
+            self._connected_at = None
 
-    async def _ping(self) -> None:
-        while True:
-            try:
-                await self._ws.send(json.dumps({ 'op': Op.HEARTBEAT }))
-                await asyncio.sleep(10)
-            except:
-                break
+            delay = self._backoff.next()
+            self._reconnects += 1
+            self.log.warning(f'{delay:.2f} 秒后尝试重连（第 {self._reconnects} 次）')
+            await asyncio.sleep(delay)
 
 
-    async def _ws_connect(self) -> None:
-        async with ws.connect(self.SERVER_URI) as websocket:
-            while True:
-                try:
+    async def _send_heartbeat(self) -> None:
+        await self._ws.send(self._codec.dumps({'op': Op.HEARTBEAT}))
 
-                    self._ws = websocket
-                    try:
-                        await asyncio.wait_for(self._initial(), self._api._timeout_sec)
-                    except asyncio.TimeoutError:
-                        self.log.error('连接超时，初始化失败！')
-                        self.log.warning(' 3 秒后尝试重新初始化')
-                        await asyncio.sleep(3)
-                        break
+    async def _on_zombie(self) -> None:
+        self.log.warning('心跳包无响应，连接可能已失效，主动断开重连')
+        transport = getattr(self._ws, 'transport', None)
+        if transport is not None:
+            transport.abort()
+        else:
+            await self._ws.close()
+
+    @property
+    def latency(self) -> Optional[float]:
+        '''
+        Rolling average of the gateway heartbeat RTT in seconds
+        '''
+        return self._heartbeat.latency
 
-                    await self._ws_startup()
 
-                    asyncio.create_task(self._ping())
+    async def _ws_connect(self) -> None:
+        async with ws.connect(self._server_uri, **self._connect_options) as websocket:
+            try:
+                self._ws = websocket
+                self._recv_bytes = 'decode' in inspect.signature(websocket.recv).parameters
+                self._counts_wire = counts_wire(websocket)
+                if self._compression == Compression.ZLIB_STREAM:
+                    self._zlib_stream = ZlibStream()
+                try:
+                    await asyncio.wait_for(self._initial(), self._api._timeout_sec)
+                except asyncio.TimeoutError:
+                    self.log.error('连接超时，初始化失败！')
+                    return
+                self._connected_at = time.monotonic()
 
-                    await self._handle_ws_event()
+                await self._ws_startup()
 
-                except ConnectionClosed as e:
-                    self.log.error(f'远程 ws 断开（错误码  {e.code} ）')
-                    self.log.warning(' 3 秒后尝试重连远程 ws ')
-                    await asyncio.sleep(3)
-                    break
+                self._heartbeat.start(self._heartbeat_interval)
 
+                await self._handle_ws_event()
+
+            except ConnectionClosed as e:
+                self.log.error(f'远程 ws 断开（错误码  {e.code} ）')
+            finally:
+                self._heartbeat.stop()
 
     async def call_action(self, action: str, **params) -> Any:
         await run_async_funcs(self._send_before, **params)
+        if self._batcher and action == ChannelApi.send_text and \
+                params.keys() == {'cid', 'content'} and params['cid']:
+            return await self._batcher.send(params['cid'], params['content'])
         return await self._api.call_action(action=action, **params)
 
+    async def broadcast(self, action: str, cids: Iterable[str], *,
+                        concurrency: Optional[int] = None,
+                        **params) -> BroadcastReport:
+        '''
+        Send one action with the same params to many channels at once
+
+        The on_send_before hooks run once with `cids` in place of `cid`, the
+        image of send_image is read once and shared by all the uploads. The
+        sends go through the rate limiter and a failed channel doesn't
+        stop the others, see the returned report
+
+        :concurrency: max sends in flight, defaults to BROADCAST_CONCURRENCY
+        '''
+        cids = list(cids)
+        await run_async_funcs(self._send_before, cids=cids, **params)
+        params = await self._api.prepare(action, **params)
+
+        async def send(cid: str) -> Any:
+            return await self._api.call_action(action, cid=cid, **params)
+
+        report = await fan_out(action, send, cids,
+                               concurrency or self._broadcast_concurrency)
+        if report.errors:
+            total = len(report.results) + len(report.errors)
+            self.log.warning(f'广播 {action} 到 {len(report.errors)}/{total} 个频道失败')
+        return report
+
+    async def _send_text_batch(self, cid: str, content: str) -> Any:
+        return await self._api.call_action(action=ChannelApi.send_text,
+                                           cid=cid, content=content)
+
     def run(self) -> None:
-        asyncio.get_event_loop().run_until_complete(self._connect())
+        loop = asyncio.get_event_loop()
+        try:
+            loop.run_until_complete(self._connect())
+        finally:
+            loop.run_until_complete(self._close())
+
+    async def _close(self) -> None:
+        '''
+        Handle the received events, deliver the batched texts and
+        release the pooled http session
+        '''
+        self._heartbeat.stop()
+        self._loop_monitor.stop()
+        if self._preload is not None:
+            self._preload.cancel()
+        await self._dispatcher.drain(self._dispatch_drain_timeout)
+        await self._dispatcher.close()
+        if self._batcher:
+            await self._batcher.close()
+        self._offloader.shutdown()
+        if self._metrics_server is not None:
+            await self._metrics_server.close()
+        await self._api.close()
 
     async def _handle_ws_event(self) -> None:
+        metrics = self._metrics
         while True:
+            data = await self._recv()
+            begin = time.perf_counter()
             try:
-                payload = json.loads(await self._ws.recv())
+                payload = self._codec.loads(data)
             except ValueError:
                 payload = None
+            if metrics is not None:
+                metrics.decode_seconds.observe(time.perf_counter() - begin)
 
             if not isinstance(payload, dict):
                 continue
 
-            asyncio.create_task(self._handle_ws_event_response(payload))
+            op = payload.get('op')
+            if metrics is not None:
+                metrics.frames.inc((str(op), payload.get('e') or ''))
+            if op == Op.HEARTBEAT_ACK:
+                self._heartbeat.ack()
+                continue
+
+            if op == Op.DISPATCH and self._resume:
+                seq = payload.get('s')
+                if seq is not None:
+                    if self._resumed and self._seq is not None and seq <= self._seq:
+                        # Replayed by the resume, already handled before the reconnect
+                        continue
+                    self._seq = seq
+
+            if op == Op.DISPATCH and self._is_echo(payload.get('d')):
+                continue
+
+            if op == Op.DISPATCH and self._shard and not self._in_shard(payload):
+                continue
+
+            if op == Op.DISPATCH:
+                # Before the subscription filter, the caches need every event
+                if self._state is not None:
+                    self._state.apply(payload.get('e'), payload.get('d'))
+                self._invalidate_on(payload.get('e'), payload.get('d'))
+
+            if op == Op.DISPATCH and not self._is_wanted(payload.get('e')):
+                self._unsubscribed_frames += 1
+                continue
+
+            await self._dispatcher.put(payload)
+
+    def _is_echo(self, d: Any) -> bool:
+        '''
+        Whether an event is the echo of a message sent by the bot, which
+        confirms the delivery of the message
+        '''
+        if not isinstance(d, dict):
+            return False
+        nonce = d.get('nonce')
+        if not isinstance(nonce, str):
+            return False
+        if self._api.nonces.confirm(nonce, d):
+            return True
+        # Sent by another shard of the bot
+        return self._shard is not None and is_own(nonce)
+
+    def _invalidate_on(self, event_type: Optional[str], d: Any) -> None:
+        '''
+        Drop the cached GET responses a gateway event makes stale
+        '''
+        if event_type in MEMBER_EVENTS and isinstance(d, dict):
+            user = d.get('user')
+            uid = user.get('id') if isinstance(user, dict) else d.get('user_id')
+            if d.get('guild_id') and uid:
+                self._api.invalidate(ChannelApi.get_channel_user_info,
+                                     gid=d['guild_id'], uid=uid)
+
+    def invalidate(self, action: Optional[str] = None, **params) -> None:
+        '''
+        Drop cached GET responses, see `HttpApi.invalidate`
+        '''
+        self._api.invalidate(action, **params)
+
+    def set_shard(self, shard_id: int, shard_count: int) -> None:
+        '''
+        Only handle the events of guilds (or channels) of shard `shard_id`,
+        the shard is also sent with IDENTIFY for gateways supporting it
+        '''
+        self._shard = (shard_id, shard_count)
+
+    def _in_shard(self, payload: Dict[str, Any]) -> bool:
+        d = payload.get('d')
+        key = None
+        if isinstance(d, dict):
+            key = d.get('guild_id') or d.get('channel_id')
+        shard_id, shard_count = self._shard
+        if key is None:
+            return shard_id == 0
+        return shard_of(key, shard_count) == shard_id
+
+    def _is_wanted(self, event_type: Optional[str]) -> bool:
+        if self._wanted_version != self._queue.version:
+            self._wanted.clear()
+            self._wanted_version = self._queue.version
+        wanted = self._wanted.get(event_type)
+        if wanted is None:
+            # Events named by a function or by guessing can't be dropped early
+            event_name = self._classifier.static_name(event_type)
+            wanted = event_name is None or self._queue.has_listeners(event_name) \
+                or self._plugin.wants(event_name)
+            self._wanted[event_type] = wanted
+        return wanted
 
     async def _handle_ws_event_response(self, payload: Dict[str, Any]) -> None:
         resp = Event.from_payload(payload)
@@ -188,28 +662,55 @@ class AioTomon(AsyncApi):
         o, e = O.get(resp.op), E.get(resp.e)
         self.log.info(f'[ {o} ]：{e}')
 
-        # TODO: More friendly information packaging
-        ctx = to_message(resp.d)
+        event_name = self._classifier.classify(resp.e, resp.d)
 
-        event_name = identify(ctx)
+        if event_name:
+            for plugin in self._plugin.load_for(event_name):
+                self.log.info(f'Life cycle [ on_load_plugin ]: {plugin} Loaded on {event_name}')
 
-        if not event_name:
+        if not event_name or not self._queue.has_listeners(event_name):
             return
 
+        # TODO: More friendly information packaging
+        ctx = to_message(resp.d)
+
         # TODO: Further processing of results
         results = list(filter(lambda r: r is not None,
                               await self._queue.emit(event_name, ctx)))
 
+    def register_event(self, event_type: str, rule: Rule) -> None:
+        '''
+        Name the gateway event `event_type` (e.g. `MESSAGE_CREATE`) by `rule`,
+        an event name or a function of the event data returning it
+        '''
+        self._classifier.register(event_type, rule)
+        self._wanted.clear()
+
     def subscribe(self, event_name: str, func: Callable) -> None:
         self._queue.subscribe(event_name, self._ensure_async(func))
 
     def unsubscribe(self, event_name: str, func: Callable) -> None:
-        self._queue.unsubscribe(event_name, func)
+        self._queue.unsubscribe(event_name, self._offloaded.get(func, func))
 
     def _ensure_async(self, func: Callable[..., Any]) -> Callable[..., Awaitable[Any]]:
+        '''
+        Sync functions run on the thread pool, or as marked by `blocking`
+        '''
         if asyncio.iscoroutinefunction(func):
             return func
-        raise OperationError
+        if not callable(func):
+            raise OperationError
+        wrapper = self._offloaded.get(func)
+        if wrapper is None:
+            wrapper = self._offloaded[func] = self._offloader.wrap(func)
+        return wrapper
+
+    async def run_in_executor(self, func: Callable[..., Any], *args,
+                              process: bool = False, **kwargs) -> Any:
+        '''
+        Run blocking work on the thread pool (or the process pool) of the bot
+        '''
+        return await self._offloader.run(func, *args, process=process, **kwargs)
 
     def on(self, *event_names: str) -> Callable:
         def deco(func: Callable) -> Callable:
@@ -242,7 +743,7 @@ class AioTomon(AsyncApi):
         self._queue.hook_before(event_name, self._ensure_async(func))
 
     def unhook_before(self, event_name: str, func: Callable) -> None:
-        self._queue.unhook_before(event_name, func)
+        self._queue.unhook_before(event_name, self._offloaded.get(func, func))
 
     def before(self, *event_names: str) -> Callable:
         '''
@@ -261,28 +762,80 @@ class AioTomon(AsyncApi):
         '''
         Life cycle 1: Before the bot starts
         '''
-        self._bot_start_before.add(self._ensure_async(func))
+        hook = self._ensure_async(func)
+        self._bot_start_before.add(hook)
+        if self._started:
+            self._run_late_hook('on_start', hook)
         return func
 
     async def _start(self) -> None:
+        self._started = True
         if self._bot_start_before:
             self.log.info('Life cycle [ on_start ]: Begin execution')
-            await run_async_funcs(self._bot_start_before)
+            await self._run_hooks('on_start', self._bot_start_before)
             self.log.info('Life cycle [ on_start ]: Finished')
 
+    async def _run_hooks(self, stage: str, hooks: Iterable[Callable[[], Awaitable[Any]]]) -> None:
+        '''
+        Run life cycle hooks concurrently, each one with its own timeout. A
+        failing or hanging hook is logged and doesn't hold up the others
+        '''
+        await asyncio.gather(*(self._run_hook(stage, hook) for hook in hooks))
+
+    async def _run_hook(self, stage: str, hook: Callable[[], Awaitable[Any]]) -> None:
+        label = func_label(hook)
+        status = 'ok'
+        begin = time.perf_counter()
+        try:
+            await asyncio.wait_for(hook(), self._startup_hook_timeout)
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            self.log.error(f'Life cycle [ {stage} ]: {label} timed out '
+                           f'after {self._startup_hook_timeout} seconds')
+        except Exception:
+            status = 'error'
+            self.log.exception(f'Life cycle [ {stage} ]: {label} failed')
+        cost = time.perf_counter() - begin
+        self._plugin.record_hook(hook.__module__, f'{stage}:{label}', cost, status)
+        self.log.info(f'Life cycle [ {stage} ]: {label} took {cost:.3f}s')
+
+    def _run_late_hook(self, stage: str, hook: Callable[[], Awaitable[Any]]) -> None:
+        task = asyncio.ensure_future(self._run_hook(stage, hook))
+        self._late_hooks.add(task)
+        task.add_done_callback(self._late_hooks.discard)
+
     def on_ws_startup(self, func: Callable) -> Callable:
         '''
         Life cycle 3: After the account is successfully logged in, 
                       before monitoring the ws report
         '''
-        self._ws_start_before.add(self._ensure_async(func))
+        hook = self._ensure_async(func)
+        self._ws_start_before.add(hook)
+        if self._ws_started:
+            self._run_late_hook('on_ws_startup', hook)
         return func
 
     async def _ws_startup(self) -> None:
+        self._ws_started = True
         if self._ws_start_before:
             self.log.info('Life cycle [ on_ws_startup ]: Begin execution')
-            await run_async_funcs(self._ws_start_before)
+            await self._run_hooks('on_ws_startup', self._ws_start_before)
             self.log.info('Life cycle [ on_ws_startup ]: Finished')
+        if self._preload_lazy_plugins and self._preload is None and self._plugin.lazy_plugins:
+            self._preload = asyncio.ensure_future(self._preload_plugins())
+
+    async def _preload_plugins(self) -> None:
+        '''
+        Import the lazy plugins one by one in the background, the event
+        loop gets control back between two imports
+        '''
+        for module_name in self._plugin.lazy_plugins:
+            await asyncio.sleep(0)
+            try:
+                if self._plugin.load_lazy(module_name):
+                    self.log.info(f'Life cycle [ on_load_plugin ]: {module_name} Preloaded')
+            except Exception:
+                self.log.exception(f'Life cycle [ on_load_plugin ]: {module_name} failed')
 
     def on_send_before(self, func: Callable) -> None:
         '''
@@ -291,6 +844,52 @@ class AioTomon(AsyncApi):
         self._send_before.add(self._ensure_async(func))
         return func
 
+    @property
+    def dispatch_stats(self) -> Dict[str, Any]:
+        '''
+        :unsubscribed: frames dropped right after decoding since no plugin
+                       listens to their event
+        '''
+        stats = self._dispatcher.stats
+        stats['unsubscribed'] = self._unsubscribed_frames
+        return stats
+
+    @property
+    def gateway_stats(self) -> Dict[str, Any]:
+        '''
+        :bytes_in: size of the received frames, compressed in zlib-stream mode
+        :bytes_decoded: size of the frames after inflating
+        '''
+        stats = self._gateway_stats.as_dict()
+        stats['compression'] = self._compression
+        return stats
+
+    def stats(self) -> Dict[str, Any]:
+        '''
+        Runtime statistics of the bot
+
+        :loop: event loop lag and stalls, `stacks` holds the stacks captured
+               during stalls with LOOP_STALL_PROFILE
+        :handlers: wall time of every handler, keyed by `module:name:line`
+        :events: wall time of handling every event name
+        '''
+        profiler = self._profiler.stats if self._profiler else {}
+        loop = self._loop_monitor.stats
+        loop['stacks'] = self._loop_monitor.stacks
+        return {
+            'loop': loop,
+            'handlers': profiler.get('handlers', {}),
+            'events': profiler.get('events', {}),
+            'dispatch': self.dispatch_stats,
+            'gateway': self.gateway_stats,
+            'latency': self.latency,
+            'rate_limit': self._api.rate_limit_stats,
+            'retry': self._api.retry_stats,
+            'echo': self._api.nonces.stats,
+            'get_cache': self._api.get_cache_stats,
+            'state': self._state.stats if self._state is not None else None
+        }
+
     @property
     def plugin(self) -> Plugins:
         return self._plugin
@@ -0,0 +1,69 @@
+
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List
+
+
+class BroadcastReport:
+    '''
+    Outcome of sending one action to many channels
+
+    :results: channel id -> response of the channels which succeeded
+    :errors: channel id -> exception of the channels which failed
+    '''
+
+    __slots__ = ('action', 'results', 'errors', 'elapsed')
+
+    def __init__(self, action: str):
+        self.action = action
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, Exception] = {}
+        self.elapsed = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    @property
+    def succeeded(self) -> List[str]:
+        return list(self.results)
+
+    @property
+    def failed(self) -> List[str]:
+        return list(self.errors)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'action': self.action,
+            'succeeded': self.succeeded,
+            'failed': {cid: repr(e) for cid, e in self.errors.items()},
+            'elapsed': self.elapsed
+        }
+
+    def __repr__(self) -> str:
+        return (f'<BroadcastReport {self.action}, succeeded={len(self.results)}, '
+                f'failed={len(self.errors)}, elapsed={self.elapsed:.3f}s>')
+
+
+async def fan_out(action: str, send: Callable[[str], Awaitable[Any]],
+                  cids: Iterable[str], concurrency: int) -> BroadcastReport:
+    '''
+    Call `send` for every distinct channel id with at most `concurrency`
+    calls in flight, a failure is recorded and the others go on
+    '''
+    report = BroadcastReport(action)
+    pending = iter(dict.fromkeys(cids))
+    begin = time.perf_counter()
+
+    async def worker() -> None:
+        for cid in pending:
+            try:
+                report.results[cid] = await send(cid)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                report.errors[cid] = e
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    report.elapsed = time.perf_counter() - begin
+    return report
@@ -0,0 +1,86 @@
+
+import copy
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class TTLCache:
+    '''
+    LRU cache whose entries expire after a ttl. Concurrent misses of the
+    same key share one fetch, a failed fetch is not cached. Every caller
+    gets its own copy of the value, mutating it doesn't touch the cache
+
+    :max_size: max number of entries, the least recently used is evicted
+    '''
+
+    def __init__(self, max_size: int = 1024):
+        self._max_size = max_size
+        # key -> (expires at, value)
+        self._items: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[Any]],
+                  ttl: float) -> Any:
+        '''
+        The cached value of `key`, or the result of `fetch` which is kept
+        for `ttl` seconds. A ttl of 0 only coalesces the concurrent fetches
+        '''
+        item = self._items.get(key)
+        if item is not None:
+            if item[0] > time.monotonic():
+                self._items.move_to_end(key)
+                self._hits += 1
+                return copy.deepcopy(item[1])
+            del self._items[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._coalesced += 1
+        else:
+            self._misses += 1
+            task = self._inflight[key] = asyncio.ensure_future(fetch())
+            task.add_done_callback(lambda t: self._fetched(key, ttl, t))
+        # A cancelled caller doesn't cancel the fetch shared with the others
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _fetched(self, key: Hashable, ttl: float, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is not task:
+            # Invalidated while in flight, the result may already be stale
+            return
+        del self._inflight[key]
+        if task.cancelled() or task.exception() is not None or ttl <= 0:
+            return
+        self._items[key] = (time.monotonic() + ttl, task.result())
+        self._items.move_to_end(key)
+        if len(self._items) > self._max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._items.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def invalidate_where(self, match: Callable[[Hashable], bool]) -> None:
+        for key in [k for k in self._items if match(k)]:
+            del self._items[key]
+        for key in [k for k in self._inflight if match(k)]:
+            del self._inflight[key]
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._inflight.clear()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._items),
+            'in_flight': len(self._inflight),
+            'hits': self._hits,
+            'misses': self._misses,
+            'coalesced': self._coalesced
+        }
@@ -0,0 +1,76 @@
+
+from typing import Any, Callable, Dict, NamedTuple, Optional, Union
+
+
+class Codec(NamedTuple):
+    '''
+    :loads: decode json from `str` or `bytes`
+    :dumps: encode to `str`, for ws text frames
+    :dumpb: encode to utf-8 `bytes`, for http bodies
+    '''
+
+    name: str
+
+    loads: Callable[[Union[str, bytes]], Any]
+
+    dumps: Callable[[Any], str]
+
+    dumpb: Callable[[Any], bytes]
+
+
+def _orjson() -> Codec:
+    import orjson
+    return Codec('orjson', orjson.loads,
+                 lambda obj: orjson.dumps(obj).decode(), orjson.dumps)
+
+
+def _ujson() -> Codec:
+    import ujson
+    return Codec('ujson', ujson.loads, ujson.dumps,
+                 lambda obj: ujson.dumps(obj).encode())
+
+
+def _json() -> Codec:
+    import json
+    dumps = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False).encode
+    return Codec('json', json.loads, dumps, lambda obj: dumps(obj).encode())
+
+
+# In order of preference
+BACKENDS = {
+    'orjson': _orjson,
+    'ujson': _ujson,
+    'json': _json
+}
+
+_codecs: Dict[str, Codec] = {}
+
+
+def get_codec(name: Optional[str] = None) -> Codec:
+    '''
+    Get the codec of `name`, None means the fastest one installed
+    '''
+    if name is None:
+        for backend in BACKENDS:
+            try:
+                return get_codec(backend)
+            except ImportError:
+                continue
+
+    codec = _codecs.get(name)
+    if codec is None:
+        if name not in BACKENDS:
+            raise ValueError(f'Unknown json codec: {name}')
+        codec = _codecs[name] = BACKENDS[name]()
+    return codec
+
+
+def available() -> Dict[str, Codec]:
+    codecs = {}
+    for backend in BACKENDS:
+        try:
+            codecs[backend] = get_codec(backend)
+        except ImportError:
+            continue
+    return codecs
+
@@ -111,6 +111,70 @@ class Message:
     OTHER = 'other'
 
 
+# Gateway event type -> event name, a handler of `a.b` also receives `a.b.c`
+EVENT_NAMES = {
+
+    'GUILD_CREATE': 'guild.create',
+
+    'GUILD_DELETE': 'guild.delete',
+
+    'GUILD_UPDATE': 'guild.update',
+
+    'GUILD_POSITION': 'guild.position',
+
+    'CHANNEL_CREATE': 'channel.create',
+
+    'CHANNEL_DELETE': 'channel.delete',
+
+    'CHANNEL_UPDATE': 'channel.update',
+
+    'CHANNEL_POSITION': 'channel.position',
+
+    'GUILD_ROLE_CREATE': 'guild.role.create',
+
+    'GUILD_ROLE_DELETE': 'guild.role.delete',
+
+    'GUILD_ROLE_UPDATE': 'guild.role.update',
+
+    'GUILD_ROLE_POSITION': 'guild.role.position',
+
+    'GUILD_MEMBER_ADD': 'guild.member.add',
+
+    'GUILD_MEMBER_REMOVE': 'guild.member.remove',
+
+    'GUILD_MEMBER_UPDATE': 'guild.member.update',
+
+    'MESSAGE_CREATE': 'message.channel.create',
+
+    'MESSAGE_UPDATE': 'message.channel.update',
+
+    # Carry no content, kept out of `message` which plugins expect to have one
+    'MESSAGE_DELETE': 'notice.message.delete',
+
+    'MESSAGE_REACTION_ADD': 'notice.reaction.add',
+
+    'MESSAGE_REACTION_REMOVE': 'notice.reaction.remove',
+
+    'MESSAGE_REACTION_REMOVE_ALL': 'notice.reaction.remove_all',
+
+    'EMOJI_CREATE': 'guild.emoji.create',
+
+    'EMOJI_DELETE': 'guild.emoji.delete',
+
+    'EMOJI_UPDATE': 'guild.emoji.update',
+
+    'VOICE_STATE_UPDATE': 'notice.voice.update',
+
+    'USER_TYPING': 'notice.typing',
+
+    'USER_PRESENCE_UPDATE': 'notice.online'
+
+}
+
+# Events changing a guild member, they make its cached responses stale
+MEMBER_EVENTS = frozenset({'GUILD_MEMBER_ADD', 'GUILD_MEMBER_UPDATE', 'GUILD_MEMBER_REMOVE'})
+
+
 class Nonce:
 
     IDENT = '202020200'
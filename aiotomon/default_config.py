@@ -1,5 +1,5 @@
 
-from typing import Optional
+from typing import Optional, Tuple, Callable, Any
 
 USER_NAME: str = ''
 PASSWORD: str = ''
@@ -8,4 +8,137 @@ PLUGINS_DIR: str = 'plugins'
 
 TIMEOUT_SEC: int = 10
 
+# HTTP connection pool, 0 means no per-host limit
+CONN_LIMIT_PER_HOST: int = 0
+KEEPALIVE_TIMEOUT: float = 15
+# None disables the DNS cache
+DNS_CACHE_TTL: Optional[int] = 10
+
 TOKEN: Optional[str] = None
+
+# Override the gateway and the api root, e.g. for a local mock server
+SERVER_URI: Optional[str] = None
+API_ROOT: Optional[str] = None
+
+# Optional client-side caps (requests per second) below the server limits.
+# None leaves the pacing to the rate limit headers of the responses
+# (Retry-After, X-RateLimit-*), which block the route or all calls
+RATE_LIMIT_GLOBAL: Optional[float] = None
+RATE_LIMIT_ROUTE: Optional[float] = None
+# Max number of calls waiting for the rate limit, 0 means unbounded
+RATE_LIMIT_MAX_QUEUE: int = 0
+# Times to queue a call again after a 429 response
+RATE_LIMIT_RETRIES: int = 3
+
+# Coalesce send_text calls to the same channel within the window (seconds)
+# into one message, None disables
+SEND_TEXT_BATCH_WINDOW: Optional[float] = None
+SEND_TEXT_BATCH_MAX_LENGTH: int = 2000
+
+# Ws events are handled by a pool of workers through a bounded queue
+DISPATCH_WORKERS: int = 16
+DISPATCH_QUEUE_SIZE: int = 1000
+# When the queue is full: 'block' / 'drop_oldest' / 'drop_type'
+DISPATCH_OVERFLOW: str = 'block'
+# Event types discarded by 'drop_type'
+DISPATCH_DROP_EVENTS: Tuple[str, ...] = ('USER_TYPING', 'USER_PRESENCE_UPDATE')
+# Seconds to wait for the queued events on shutdown, the events still
+# unhandled then are cancelled
+DISPATCH_DRAIN_TIMEOUT: float = 5
+# Handle the events of one channel in order, different channels in parallel
+DISPATCH_ORDERED: bool = False
+# Shard key of the ordered mode, called with the event data,
+# None means the channel_id
+DISPATCH_ORDER_KEY: Optional[Callable[[Any], Any]] = None
+
+# Json codec: 'orjson' / 'ujson' / 'json', None means the fastest installed
+JSON_CODEC: Optional[str] = None
+
+# Gateway compression: None (websockets defaults) / 'deflate' / 'zlib-stream'
+GATEWAY_COMPRESSION: Optional[str] = None
+# Window bits (9 - 15) and memory level (1 - 9) of 'deflate'
+GATEWAY_DEFLATE_WINDOW_BITS: Optional[int] = None
+GATEWAY_DEFLATE_MEM_LEVEL: Optional[int] = None
+
+# Heartbeat interval (seconds) used when the HELLO payload doesn't carry one
+HEARTBEAT_INTERVAL: float = 10
+# Reconnect after this many heartbeats in a row got no ACK
+HEARTBEAT_MAX_MISSED: int = 2
+
+# Reconnect delays grow from BASE up to CAP seconds with random jitter
+RECONNECT_BACKOFF_BASE: float = 0.5
+RECONNECT_BACKOFF_CAP: float = 60
+# Send the session id and the last sequence number on reconnect so the
+# gateway can replay the missed events, if it supports that
+GATEWAY_RESUME: bool = False
+
+# Workers of the pools running sync handlers, None means the default
+OFFLOAD_THREADS: Optional[int] = None
+OFFLOAD_PROCESSES: Optional[int] = None
+
+# Time every handler, handlers slower than the threshold (seconds) are logged
+PROFILE_HANDLERS: bool = True
+SLOW_HANDLER_THRESHOLD: float = 1.0
+# Measure the event loop lag every interval, a lag over the threshold
+# (seconds) is a stall, LOOP_STALL_PROFILE captures the stack of stalls
+LOOP_MONITOR_INTERVAL: float = 0.5
+LOOP_STALL_THRESHOLD: float = 0.5
+LOOP_STALL_PROFILE: bool = False
+
+# Collect the Prometheus metrics, a port serves them on
+# http://METRICS_HOST:METRICS_PORT/metrics while the bot runs
+METRICS: bool = False
+METRICS_HOST: str = '127.0.0.1'
+METRICS_PORT: Optional[int] = None
+
+# Cache the bytes of sent image files up to this many bytes in total,
+# keyed by path and mtime, 0 disables the cache
+IMAGE_CACHE_SIZE: int = 0
+# Upload uncached image files chunk by chunk instead of reading them whole
+IMAGE_STREAM: bool = False
+
+# Max sends in flight of bot.broadcast
+BROADCAST_CONCURRENCY: int = 10
+
+# Keep users, members, channels, roles and guilds from the gateway events,
+# get_user_info and get_channel_user_info are served from it first.
+# The caps are per type, least recently used entities are evicted first
+STATE_CACHE: bool = True
+STATE_MAX_USERS: Optional[int] = 10000
+STATE_MAX_MEMBERS: Optional[int] = 50000
+STATE_MAX_CHANNELS: Optional[int] = 10000
+STATE_MAX_ROLES: Optional[int] = 10000
+STATE_MAX_GUILDS: Optional[int] = 1000
+
+# Cache up to GET_CACHE_SIZE responses of the GET actions for GET_CACHE_TTL
+# seconds, concurrent identical requests share one request. 0 disables
+GET_CACHE_SIZE: int = 1024
+GET_CACHE_TTL: float = 5
+
+# Retry failed api calls with jittered exponential backoff. GETs and the
+# messages (sent with a unique nonce) are retried on RETRY_STATUSES, timeouts
+# and connection errors, other calls only when the connection never opened.
+# All the attempts of a call share RETRY_DEADLINE, None means 3 * TIMEOUT_SEC
+RETRY_ATTEMPTS: int = 3
+RETRY_BACKOFF_BASE: float = 0.5
+RETRY_BACKOFF_CAP: float = 8
+RETRY_DEADLINE: Optional[float] = None
+RETRY_STATUSES: Tuple[int, ...] = (500, 502, 503, 504)
+# Fail fast for CIRCUIT_BREAKER_RESET seconds after that many failed calls in
+# a row (5xx, timeouts, connection errors once retried), 0 disables the breaker
+CIRCUIT_BREAKER_THRESHOLD: int = 5
+CIRCUIT_BREAKER_RESET: float = 30
+
+# Nonces of the sent messages are kept NONCE_TTL seconds (at most
+# NONCE_MAX_SIZE of them) to recognize their gateway echo
+NONCE_TTL: float = 60
+NONCE_MAX_SIZE: int = 10000
+
+# Life cycle hooks (on_startup, on_ws_startup) run concurrently, each one
+# is cancelled after this many seconds, None means no timeout
+STARTUP_HOOK_TIMEOUT: Optional[float] = 30
+
+# Import the plugins deferred by their manifest in the background once the
+# bot is up, so their first event doesn't wait for the import. False
+# imports each one when its first event arrives
+PRELOAD_LAZY_PLUGINS: bool = True
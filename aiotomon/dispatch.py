@@ -0,0 +1,193 @@
+
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+from .metrics import BotMetrics
+
+
+class Overflow:
+
+    BLOCK = 'block'
+
+    DROP_OLDEST = 'drop_oldest'
+
+    DROP_TYPE = 'drop_type'
+
+
+def channel_key(d: Any) -> Optional[Hashable]:
+    '''
+    Default shard key of the ordered mode: the channel of the event
+    '''
+    if isinstance(d, dict):
+        return d.get('channel_id')
+    return None
+
+
+class Dispatcher:
+    '''
+    Hand ws payloads to a fixed pool of workers through a bounded queue
+
+    :handler: coroutine function handling one payload
+    :workers: number of payloads handled concurrently
+    :queue_size: max number of payloads waiting, 0 means unbounded
+    :overflow: what to do when the queue is full
+        `block`: the ws reader waits for a free slot
+        `drop_oldest`: the oldest waiting payload is discarded
+        `drop_type`: an incoming payload of `drop_events` is discarded,
+                     other payloads block the reader
+    :drop_events: gateway event types which may be discarded
+    :ordered: shard payloads by `key` onto serial lanes, payloads with the
+        same key are handled one by one in order, different lanes still run
+        in parallel. Each worker owns a lane with `queue_size / workers` slots
+    :key: shard key of the ordered mode, called with the payload's `d`
+    :metrics: records the handling time and the errors by event type
+    '''
+
+    def __init__(self, handler: Callable[[Dict[str, Any]], Awaitable[Any]], *,
+                 workers: int = 16,
+                 queue_size: int = 1000,
+                 overflow: str = Overflow.BLOCK,
+                 drop_events: Iterable[str] = (),
+                 ordered: bool = False,
+                 key: Optional[Callable[[Any], Optional[Hashable]]] = None,
+                 metrics: Optional[BotMetrics] = None,
+                 log: Optional[logging.Logger] = None):
+        if overflow not in {Overflow.BLOCK, Overflow.DROP_OLDEST, Overflow.DROP_TYPE}:
+            raise ValueError(f'Unknown overflow policy: {overflow}')
+
+        self._handler = handler
+        self._workers_num = max(1, workers)
+        self._queue_size = queue_size
+        self._overflow = overflow
+        self._drop_events = frozenset(drop_events)
+        self._ordered = ordered
+        self._key = key or channel_key
+        self._log = log or logging.getLogger(__name__)
+        self._metrics = metrics
+
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        self._next_lane = 0
+        self._in_flight = 0
+
+        self._dropped = 0
+        self._handled = 0
+        self._errors = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        if not self._queues:
+            if self._ordered:
+                lane_size = -(-self._queue_size // self._workers_num)
+                self._queues = [asyncio.Queue(lane_size)
+                                for _ in range(self._workers_num)]
+            else:
+                self._queues = [asyncio.Queue(self._queue_size)]
+        self._workers = [
+            asyncio.ensure_future(self._work(self._queues[i % len(self._queues)]))
+            for i in range(self._workers_num)
+        ]
+
+    def _select(self, payload: Dict[str, Any]) -> asyncio.Queue:
+        if not self._ordered:
+            return self._queues[0]
+        key = self._key(payload.get('d'))
+        if key is None:
+            # Events without a key keep no order, spread them over the lanes
+            self._next_lane = (self._next_lane + 1) % len(self._queues)
+            return self._queues[self._next_lane]
+        return self._queues[hash(key) % len(self._queues)]
+
+    async def put(self, payload: Dict[str, Any]) -> None:
+        queue = self._select(payload)
+        if not queue.full() or self._overflow == Overflow.BLOCK:
+            await queue.put(payload)
+            return
+
+        if self._overflow == Overflow.DROP_OLDEST:
+            try:
+                queue.get_nowait()
+                queue.task_done()
+                self._dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+            queue.put_nowait(payload)
+            return
+
+        # Overflow.DROP_TYPE
+        if payload.get('e') in self._drop_events:
+            self._dropped += 1
+            return
+        await queue.put(payload)
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            payload = await queue.get()
+            # Frames without an event type still get a usable metric label
+            label = (payload.get('e') or 'unknown',)
+            self._in_flight += 1
+            begin = time.perf_counter()
+            try:
+                await self._handler(payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._errors += 1
+                if self._metrics is not None:
+                    self._metrics.handler_errors.inc(label)
+                self._log.exception('处理 ws 事件时发生错误')
+            finally:
+                cost = time.perf_counter() - begin
+                if self._metrics is not None:
+                    self._metrics.dispatch_seconds.observe(cost, label)
+                self._handled += 1
+                self._latency_total += cost
+                if cost > self._latency_max:
+                    self._latency_max = cost
+                self._in_flight -= 1
+                queue.task_done()
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        '''
+        Wait at most `timeout` seconds for the queued and in-flight payloads,
+        e.g. before shutting down. Nothing is cancelled or discarded here
+        '''
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            self._log.warning(f'仍有 {self.queue_depth} 个事件未处理，'
+                              f'{self._in_flight} 个事件处理中')
+
+    async def close(self) -> None:
+        '''
+        Cancel the workers, the payloads in flight are cancelled too
+        '''
+        for worker in self._workers:
+            worker.cancel()
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queue_depth': self.queue_depth,
+            'in_flight': self._in_flight,
+            'handled': self._handled,
+            'dropped': self._dropped,
+            'errors': self._errors,
+            'latency_avg': self._latency_total / self._handled if self._handled else 0.0,
+            'latency_max': self._latency_max
+        }
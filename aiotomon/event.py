@@ -1,9 +1,9 @@
 
+import time
 import asyncio
-from collections import defaultdict
-from typing import Optional, Any, Dict, Iterable, Awaitable, Callable, List
+from typing import Optional, Any, Dict, Iterable, Awaitable, Callable, List, Set, Tuple
 
-from .config import Nonce as No, Op
+from .config import Op
 
 
 class Event(dict):
@@ -18,10 +18,6 @@ class Event(dict):
 
             _ = resp.op, resp.e, resp.d
 
-            # ! Ugly way, needs improvement
-            if resp.d['nonce'] == No.IDENT:
-                return None
-
             return resp
         except KeyError:
             return None
@@ -39,41 +35,75 @@ class Event(dict):
 class EventQueue:
 
     def __init__(self):
-        self._subscribers = defaultdict(set)
-        self._hooks_before = defaultdict(set)
+        self._subscribers: Dict[str, Set[Callable]] = {}
+        self._hooks_before: Dict[str, Set[Callable]] = {}
+        # event name -> (hooks, handlers) of the event and all its parents
+        self._resolved: Dict[str, Tuple[Tuple[Callable, ...], Tuple[Callable, ...]]] = {}
+        # Bumped on every change of the subscriptions
+        self.version = 0
+        # A `HandlerProfiler` timing every hook and handler, None disables
+        self.profiler = None
+
+    def _changed(self) -> None:
+        self._resolved.clear()
+        self.version += 1
 
     def subscribe(self, event: str, func: Callable) -> None:
-        self._subscribers[event].add(func)
+        self._subscribers.setdefault(event, set()).add(func)
+        self._changed()
 
     def unsubscribe(self, event: str, func: Callable) -> None:
-        if func in self._subscribers[event]:
+        if func in self._subscribers.get(event, ()):
             self._subscribers[event].remove(func)
+            self._changed()
 
     def hook_before(self, event: str, func: Callable) -> None:
-        self._hooks_before[event].add(func)
+        self._hooks_before.setdefault(event, set()).add(func)
+        self._changed()
 
     def unhook_before(self, event: str, func: Callable) -> None:
-        if func in self._hooks_before[event]:
+        if func in self._hooks_before.get(event, ()):
             self._hooks_before[event].remove(func)
+            self._changed()
+
+    def _resolve(self, event: str) -> Tuple[Tuple[Callable, ...], Tuple[Callable, ...]]:
+        '''
+        Flatten the funcs of `a.b.c`, `a.b` and `a`, the most specific first
+        '''
+        resolved = self._resolved.get(event)
+        if resolved is None:
+            hooks, handlers = [], []
+            parts = event.split('.')
+            for i in range(len(parts), 0, -1):
+                name = '.'.join(parts[:i])
+                hooks += self._hooks_before.get(name, ())
+                handlers += self._subscribers.get(name, ())
+            resolved = self._resolved[event] = (tuple(hooks), tuple(handlers))
+        return resolved
+
+    def has_listeners(self, event: str) -> bool:
+        hooks, handlers = self._resolve(event)
+        return bool(hooks or handlers)
 
     async def emit(self, event: str, *args, **kwargs) -> List[Any]:
-        event_copy = event
-
-        while True:
-            await run_async_funcs(self._hooks_before[event], *args, **kwargs)
-            event, *sub_event = event.rsplit('.', maxsplit=1)
-            if not sub_event:
-                break
-        event = event_copy
-
-        results = []
-        while True:
-            results += await run_async_funcs(self._subscribers[event],
-                                             *args, **kwargs)
-            event, *sub_event = event.rsplit('.', maxsplit=1)
-            if not sub_event:
-                break
-        return results
+        hooks, handlers = self._resolve(event)
+        profiler = self.profiler
+        if profiler is None:
+            if hooks:
+                await run_async_funcs(hooks, *args, **kwargs)
+            return await run_async_funcs(handlers, *args, **kwargs)
+
+        begin = time.perf_counter()
+        try:
+            if hooks:
+                await asyncio.gather(*[profiler.timed(event, f, f(*args, **kwargs))
+                                       for f in hooks])
+            if not handlers:
+                return []
+            return list(await asyncio.gather(*[profiler.timed(event, f, f(*args, **kwargs))
+                                               for f in handlers]))
+        finally:
+            profiler.record_event(event, time.perf_counter() - begin)
 
 
 async def run_async_funcs(funcs: Iterable[Callable[..., Awaitable[Any]]],
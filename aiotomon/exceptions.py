@@ -17,6 +17,10 @@ class HttpFailed(ApiError):
     def __init__(self, status: int):
         self._status = status
 
+    @property
+    def status(self) -> int:
+        return self._status
+
     def __repr__(self):
         return f'<HttpFailed, status_code={self._status}>'
 
@@ -24,6 +28,15 @@ class HttpFailed(ApiError):
         return self.__repr__()
 
 
+class RateLimitRejected(HttpFailed):
+    '''
+    Given up by the client-side rate limiter, no request was sent
+    '''
+
+    def __init__(self):
+        super().__init__(429)
+
+
 class NetworkError(Error, IOError):
     pass
 
@@ -32,5 +45,9 @@ class ResponseError(NetworkError):
     pass
 
 
+class CircuitOpenError(NetworkError):
+    pass
+
+
 class OperationError(Error, RuntimeError):
     pass
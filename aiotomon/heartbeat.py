@@ -0,0 +1,77 @@
+
+import time
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional
+
+
+class Heartbeat:
+    '''
+    Send heartbeats of one connection and match the ACKs to measure the RTT
+
+    :send: coroutine function sending one heartbeat
+    :on_zombie: called when `max_missed` heartbeats in a row got no ACK
+    :samples: number of RTTs the latency is averaged over
+    '''
+
+    def __init__(self, send: Callable[[], Awaitable[None]],
+                 on_zombie: Callable[[], Awaitable[None]], *,
+                 max_missed: int = 2,
+                 samples: int = 20):
+        self._send = send
+        self._on_zombie = on_zombie
+        self._max_missed = max_missed
+        self._rtts: Deque[float] = deque(maxlen=samples)
+        self._task: Optional[asyncio.Task] = None
+        self._sent_at: Optional[float] = None
+        self._missed = 0
+
+    def start(self, interval: float) -> None:
+        '''
+        Start beating every `interval` seconds, a running loop is stopped first
+        '''
+        self.stop()
+        self._sent_at = None
+        self._missed = 0
+        self._task = asyncio.ensure_future(self._beat(interval))
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def ack(self) -> None:
+        if self._sent_at is None:
+            return
+        self._rtts.append(time.monotonic() - self._sent_at)
+        self._sent_at = None
+        self._missed = 0
+
+    async def _beat(self, interval: float) -> None:
+        while True:
+            if self._sent_at is not None:
+                self._missed += 1
+                if self._missed >= self._max_missed:
+                    self._task = None
+                    await self._on_zombie()
+                    return
+            try:
+                await self._send()
+            except Exception:
+                return
+            if self._sent_at is None:
+                self._sent_at = time.monotonic()
+            await asyncio.sleep(interval)
+
+    @property
+    def latency(self) -> Optional[float]:
+        '''
+        Rolling average of the heartbeat RTT in seconds, None before any ACK
+        '''
+        if not self._rtts:
+            return None
+        return sum(self._rtts) / len(self._rtts)
+
+    @property
+    def last_rtt(self) -> Optional[float]:
+        return self._rtts[-1] if self._rtts else None
@@ -1,28 +1,56 @@
 
 
-from typing import Any, Dict, List, Union
+from typing import Any, Callable, Dict, Optional, Union
 
-from .config import Message as M
+from .config import Message as M, EVENT_NAMES
 
 
 class Message(dict):
+    '''
+    Attribute access view of a payload, a nested dict is wrapped into
+    a `Message` only when it is accessed for the first time
+    '''
+
+    __slots__ = ()
 
     __setattr__ = dict.__setitem__
-    __getattr__ = dict.__getitem__
 
+    def __getitem__(self, key: str) -> Any:
+        value = dict.__getitem__(self, key)
+        if type(value) is dict:
+            value = Message(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def __getattr__(self, key: str) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            if key.startswith('__'):
+                raise AttributeError(key)
+            raise
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __reduce__(self):
+        # Pickled as a plain copy, e.g. for handlers in the process pool
+        return Message, (dict(self),)
 
-def to_message(result: Dict[str, Any]) -> List[Union[str, Message]]:
+
+def to_message(result: Dict[str, Any]) -> Union[Message, Any]:
     if not isinstance(result, dict):
         return result
-    d = Message()
-    for k, v in result.items():
-        d[k] = to_message(v)
-    return d
+    return Message(result)
 
 
-# TODO: More message types
-# TODO: Avoid ugly, use mapping
-def identify(result: Message) -> str:
+def identify(result: Dict[str, Any]) -> str:
+    '''
+    Guess the event name from the payload, used for unknown event types
+    '''
     if result.get('status'):
         return M.NOTICE_ONLINE
     elif result.get('content'):
@@ -30,6 +58,39 @@ def identify(result: Message) -> str:
     return M.OTHER
 
 
+Rule = Union[str, Callable[[Dict[str, Any]], Optional[str]]]
+
+
+class Classifier:
+    '''
+    Map the gateway event type (the `e` field) to an event name
+
+    A rule is either the event name or a function of the payload data
+    returning the event name, `None` means the event is ignored
+    '''
+
+    def __init__(self):
+        self._rules: Dict[str, Rule] = dict(EVENT_NAMES)
+
+    def register(self, event_type: str, rule: Rule) -> None:
+        self._rules[event_type] = rule
+
+    def static_name(self, event_type: Optional[str]) -> Optional[str]:
+        '''
+        The event name of `event_type` if it doesn't depend on the payload
+        '''
+        rule = self._rules.get(event_type)
+        return rule if type(rule) is str else None
+
+    def classify(self, event_type: Optional[str], d: Any) -> Optional[str]:
+        rule = self._rules.get(event_type)
+        if rule is None:
+            return identify(d) if isinstance(d, dict) else None
+        if type(rule) is str:
+            return rule
+        return rule(d)
+
+
 class MessageSegment:
 
     @staticmethod
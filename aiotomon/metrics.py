@@ -0,0 +1,223 @@
+
+import math
+import logging
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from aiohttp import web
+
+Labels = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names: Sequence[str], values: Labels,
+                   extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    '''
+    Monotonic counter, written only from the event loop thread so the hot
+    path is a plain dict update without any lock
+    '''
+
+    kind = 'counter'
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), value: float = 1) -> None:
+        values = self._values
+        values[labels] = values.get(labels, 0) + value
+
+    def value(self, labels: Labels = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}'
+                for labels, v in list(self._values.items())]
+
+
+class Histogram:
+    '''
+    Histogram with fixed upper bounds, the counts are kept per bucket and
+    only made cumulative when rendered
+    '''
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._bounds = tuple(sorted(buckets))
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        counts = self._values.get(labels)
+        if counts is None:
+            counts = self._values[labels] = [0] * (len(self._bounds) + 1) + [0.0]
+        counts[bisect_left(self._bounds, value)] += 1
+        counts[-1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, counts in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self._bounds + (math.inf,), counts):
+                cumulative += count
+                le = ('le', _format_value(bound))
+                lines.append(f'{self.name}_bucket'
+                             f'{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_str} {_format_value(counts[-1])}')
+            lines.append(f'{self.name}_count{label_str} {cumulative}')
+        return lines
+
+
+class Callback:
+    '''
+    Gauge or counter read from `func` at scrape time, `func` returns a
+    number, None for no sample, or a dict of label values to numbers
+    '''
+
+    def __init__(self, name: str, doc: str,
+                 func: Callable[[], Union[None, float, Dict[Labels, float]]],
+                 labelnames: Sequence[str] = (),
+                 kind: str = 'gauge'):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        self._func = func
+
+    def samples(self) -> List[str]:
+        value = self._func()
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}'
+                for labels, v in value.items() if v is not None]
+
+
+class Registry:
+
+    def __init__(self, prefix: str = 'aiotomon_'):
+        self._prefix = prefix
+        self._metrics: Dict[str, Any] = {}
+
+    def _add(self, metric: Any) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, doc: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(self._prefix + name, doc, labelnames))
+
+    def histogram(self, name: str, doc: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(self._prefix + name, doc, labelnames, buckets))
+
+    def callback(self, name: str, doc: str,
+                 func: Callable[[], Union[None, float, Dict[Labels, float]]],
+                 labelnames: Sequence[str] = (),
+                 kind: str = 'gauge') -> Callback:
+        return self._add(Callback(self._prefix + name, doc, func, labelnames, kind))
+
+    def render(self) -> str:
+        '''
+        The Prometheus text exposition format
+        '''
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.doc}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class BotMetrics:
+    '''
+    The instruments the bot, the dispatcher and HttpApi write to
+    '''
+
+    def __init__(self, registry: Optional[Registry] = None):
+        self.registry = registry or Registry()
+        r = self.registry
+        self.frames = r.counter('gateway_frames_total',
+                                'Gateway frames received', ('op', 'event'))
+        self.decode_seconds = r.histogram(
+            'gateway_decode_seconds', 'Time decoding a gateway frame',
+            buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025,
+                     0.0005, 0.001, 0.0025, 0.005, 0.01))
+        self.dispatch_seconds = r.histogram('dispatch_seconds',
+                                            'Time handling a dispatched event', ('event',))
+        self.handler_errors = r.counter('handler_errors_total',
+                                        'Events whose handlers raised', ('event',))
+        self.http_requests = r.counter('http_requests_total',
+                                       'Http requests sent by action and status', ('action', 'status'))
+        self.http_seconds = r.histogram('http_request_seconds',
+                                        'Http request latency by action', ('action',))
+        self.echo_seconds = r.histogram('message_echo_seconds',
+                                        'Time from sending a message to its gateway echo')
+
+    def observe_http(self, action: str, status: str, cost: float) -> None:
+        self.http_requests.inc((action, status))
+        self.http_seconds.observe(cost, (action,))
+
+
+class MetricsServer:
+    '''
+    Serve `registry` on `http://host:port/metrics`
+    '''
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, registry: Registry, host: str = '127.0.0.1', port: int = 9464,
+                 log: Optional[logging.Logger] = None):
+        self._registry = registry
+        self._host = host
+        self._port = port
+        self._log = log or logging.getLogger(__name__)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=self._registry.render().encode(),
+                            headers={'Content-Type': self.CONTENT_TYPE})
+
+    async def start(self) -> None:
+        if self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+        self._log.info(f'Metrics on http://{self._host}:{self._port}/metrics')
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
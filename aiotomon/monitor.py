@@ -0,0 +1,193 @@
+
+import sys
+import time
+import asyncio
+import inspect
+import logging
+import threading
+import traceback
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+
+class Timing:
+
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, cost: float) -> None:
+        self.count += 1
+        self.total += cost
+        if cost > self.max:
+            self.max = cost
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'avg': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'total': self.total
+        }
+
+
+def func_label(func: Callable) -> str:
+    '''
+    `module:qualname:line`, handlers are often all named `_`
+    '''
+    origin = inspect.unwrap(func)
+    code = getattr(origin, '__code__', None)
+    line = code.co_firstlineno if code else 0
+    return f'{func.__module__}:{func.__qualname__}:{line}'
+
+
+class HandlerProfiler:
+    '''
+    Wall time of every handler and of every event name
+
+    :slow_threshold: handlers slower than this (seconds) are logged
+    :owner: finds the plugin of a module name
+    '''
+
+    def __init__(self, slow_threshold: float = 1.0,
+                 owner: Optional[Callable[[str], Optional[str]]] = None,
+                 log: Optional[logging.Logger] = None):
+        self._slow_threshold = slow_threshold
+        self._owner = owner
+        self._log = log or logging.getLogger(__name__)
+        self._handlers: Dict[Callable, Timing] = {}
+        self._events: Dict[str, Timing] = {}
+
+    async def timed(self, event: str, func: Callable, coro: Awaitable[Any]) -> Any:
+        begin = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            cost = time.perf_counter() - begin
+            timing = self._handlers.get(func)
+            if timing is None:
+                timing = self._handlers[func] = Timing()
+            timing.add(cost)
+            if cost > self._slow_threshold:
+                plugin = self._owner(func.__module__) if self._owner else None
+                where = f'（插件 {plugin}）' if plugin else ''
+                self._log.warning(f'[ {func_label(func)} ]{where}'
+                                  f'处理 {event} 耗时 {cost:.3f} 秒')
+
+    def record_event(self, event: str, cost: float) -> None:
+        timing = self._events.get(event)
+        if timing is None:
+            timing = self._events[event] = Timing()
+        timing.add(cost)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'handlers': {func_label(f): t.as_dict() for f, t in self._handlers.items()},
+            'events': {e: t.as_dict() for e, t in self._events.items()}
+        }
+
+
+class LoopMonitor:
+    '''
+    Measure the event loop lag with a periodic callback
+
+    With `profile`, a watchdog thread captures the stack of the loop thread
+    once the loop hasn't run the callback for `stall_threshold` seconds
+
+    :interval: seconds between two checks
+    :stall_threshold: a lag over this (seconds) counts as a stall
+    :samples: number of captured stacks kept
+    '''
+
+    def __init__(self, interval: float = 0.5,
+                 stall_threshold: float = 0.5, *,
+                 profile: bool = False,
+                 samples: int = 10,
+                 log: Optional[logging.Logger] = None):
+        self._interval = interval
+        self._stall_threshold = stall_threshold
+        self._profile = profile
+        self._log = log or logging.getLogger(__name__)
+
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._expected = 0.0
+        self._last_tick = 0.0
+        self._loop_thread: Optional[int] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._captured_tick = 0.0
+
+        self._lag = Timing()
+        self._last_lag = 0.0
+        self._stalls = 0
+        self._stacks: Deque[Dict[str, Any]] = deque(maxlen=samples)
+
+    def start(self) -> None:
+        if self._handle is not None:
+            return
+        loop = asyncio.get_event_loop()
+        self._loop_thread = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._schedule(loop)
+        if self._profile and self._watchdog is None:
+            self._stopped.clear()
+            self._watchdog = threading.Thread(target=self._watch,
+                                              name='aiotomon-watchdog', daemon=True)
+            self._watchdog.start()
+
+    def stop(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._stopped.set()
+        self._watchdog = None
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._expected = time.monotonic() + self._interval
+        self._handle = loop.call_later(self._interval, self._tick, loop)
+
+    def _tick(self, loop: asyncio.AbstractEventLoop) -> None:
+        now = time.monotonic()
+        lag = max(0.0, now - self._expected)
+        self._last_tick = now
+        self._last_lag = lag
+        self._lag.add(lag)
+        if lag > self._stall_threshold:
+            self._stalls += 1
+            self._log.warning(f'事件循环阻塞了 {lag:.3f} 秒')
+        self._schedule(loop)
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self._stall_threshold / 2):
+            stalled = time.monotonic() - self._last_tick - self._interval
+            if stalled > self._stall_threshold and self._captured_tick != self._last_tick:
+                # One stack per stall
+                self._captured_tick = self._last_tick
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is None:
+                    continue
+                self._stacks.append({
+                    'time': time.time(),
+                    'stalled': stalled,
+                    'stack': ''.join(traceback.format_stack(frame))
+                })
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'lag': self._last_lag,
+            'lag_avg': self._lag.as_dict()['avg'],
+            'lag_max': self._lag.max,
+            'stalls': self._stalls
+        }
+
+    @property
+    def stacks(self) -> List[Dict[str, Any]]:
+        '''
+        Stacks of the loop thread captured during stalls, the oldest first
+        '''
+        return list(self._stacks)
@@ -0,0 +1,159 @@
+
+import time
+import random
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .config import Nonce
+from .monitor import Timing
+from .metrics import BotMetrics
+
+
+def new_nonce() -> str:
+    '''
+    A unique nonce of one sent message, prefixed by `Nonce.IDENT` so the
+    echo of a message sent by another shard of the bot is still recognized
+    '''
+    return f'{Nonce.IDENT}{random.randrange(10 ** 16):016d}'
+
+
+def is_own(nonce: object) -> bool:
+    return isinstance(nonce, str) and nonce.startswith(Nonce.IDENT)
+
+
+class Delivery:
+    '''
+    A sent message waiting for its gateway echo, awaiting it gives the
+    echoed message once the gateway confirmed the delivery
+
+    :response: the http response of the send
+    '''
+
+    __slots__ = ('nonce', 'response', 'sent_at', 'confirmed_at', '_future')
+
+    def __init__(self, nonce: str, sent_at: float):
+        self.nonce = nonce
+        self.response: Any = None
+        self.sent_at = sent_at
+        self.confirmed_at: Optional[float] = None
+        self._future = asyncio.get_event_loop().create_future()
+
+    def __await__(self):
+        return asyncio.shield(self._future).__await__()
+
+    async def wait(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        return await asyncio.wait_for(asyncio.shield(self._future), timeout)
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    @property
+    def latency(self) -> Optional[float]:
+        '''
+        Seconds from the send to the echo, None before the echo
+        '''
+        if self.confirmed_at is None:
+            return None
+        return self.confirmed_at - self.sent_at
+
+    def __repr__(self) -> str:
+        return f'<Delivery {self.nonce}, latency={self.latency}>'
+
+
+class _Sent:
+
+    __slots__ = ('at', 'delivery', 'confirmed')
+
+    def __init__(self, at: float):
+        self.at = at
+        self.delivery: Optional[Delivery] = None
+        self.confirmed = False
+
+
+class NonceTracker:
+    '''
+    Nonces of the recently sent messages, the echo of an own message is
+    found by a dict lookup. Nonces expire after `ttl` seconds and at most
+    `max_size` are kept, the oldest are dropped first
+
+    :metrics: records the send to echo latency
+    '''
+
+    def __init__(self, ttl: float = 60, max_size: int = 10000,
+                 metrics: Optional[BotMetrics] = None):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._metrics = metrics
+        # Oldest first
+        self._sent: 'OrderedDict[str, _Sent]' = OrderedDict()
+
+        self._latency = Timing()
+        self._expired = 0
+
+    def issue(self) -> str:
+        nonce = new_nonce()
+        self._add(nonce)
+        return nonce
+
+    def track(self, nonce: str) -> Delivery:
+        '''
+        Wait for the echo of `nonce`, which is issued when new
+        '''
+        sent = self._sent.get(nonce)
+        if sent is None:
+            sent = self._add(nonce)
+        if sent.delivery is None:
+            sent.delivery = Delivery(nonce, sent.at)
+        return sent.delivery
+
+    def _add(self, nonce: str) -> _Sent:
+        now = time.monotonic()
+        sent = self._sent[nonce] = _Sent(now)
+        self._expire(now)
+        return sent
+
+    def _expire(self, now: float) -> None:
+        items = self._sent
+        while items:
+            nonce, sent = next(iter(items.items()))
+            if len(items) <= self._max_size and now - sent.at < self._ttl:
+                break
+            del items[nonce]
+            if not sent.confirmed:
+                self._expired += 1
+                if sent.delivery is not None:
+                    sent.delivery._future.set_exception(asyncio.TimeoutError())
+                    # Retrieved here, nobody may be waiting for it any more
+                    sent.delivery._future.exception()
+
+    def confirm(self, nonce: Any, d: Dict[str, Any]) -> bool:
+        '''
+        Whether `nonce` was sent by this bot, the first echo confirms the
+        delivery and later ones are only recognized
+        '''
+        sent = self._sent.get(nonce)
+        if sent is None:
+            return False
+        if not sent.confirmed:
+            sent.confirmed = True
+            now = time.monotonic()
+            cost = now - sent.at
+            self._latency.add(cost)
+            if self._metrics is not None:
+                self._metrics.echo_seconds.observe(cost)
+            if sent.delivery is not None:
+                sent.delivery.confirmed_at = now
+                sent.delivery._future.set_result(d)
+        return True
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        latency = self._latency.as_dict()
+        return {
+            'tracked': len(self._sent),
+            'confirmed': latency['count'],
+            'expired': self._expired,
+            'latency_avg': latency['avg'],
+            'latency_max': latency['max']
+        }
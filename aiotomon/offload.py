@@ -0,0 +1,133 @@
+
+import sys
+import pickle
+import asyncio
+import functools
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, List, NamedTuple, Optional
+
+
+class Offload(NamedTuple):
+
+    process: bool = False
+
+    concurrency: Optional[int] = None
+
+
+def blocking(func: Optional[Callable] = None, *,
+             process: bool = False,
+             concurrency: Optional[int] = None) -> Callable:
+    '''
+    Mark a sync handler as blocking work
+
+    :process: run it in the process pool instead of the thread pool, the
+              function and its arguments must be picklable, i.e. a uniquely
+              named module level function importable in a fresh process.
+              Keep it in a module which doesn't call `get_bot()` on import
+    :concurrency: max number of runs of this handler at the same time
+    '''
+    def deco(f: Callable) -> Callable:
+        if process:
+            check_importable(f)
+        f.__aiotomon_offload__ = Offload(process, concurrency)
+        return f
+
+    if func is not None:
+        return deco(func)
+    return deco
+
+
+def check_importable(func: Callable) -> None:
+    '''
+    Raise TypeError if `func` can't be found by its qualified name in a
+    fresh process, which the process pool needs to pickle it. Called
+    before the name is bound, so a name taken by another object fails too
+    '''
+    name = getattr(func, '__name__', '')
+    qualname = getattr(func, '__qualname__', name)
+    module = sys.modules.get(getattr(func, '__module__', None))
+    if module is None or '<' in qualname or name == '_':
+        raise TypeError(f'{qualname} can\'t run in a process, it must be a '
+                        f'uniquely named module level function')
+    bound = getattr(module, qualname.split('.')[0], func)
+    if bound is not func and getattr(bound, '__qualname__', None) == qualname:
+        raise TypeError(f'{module.__name__}.{qualname} can\'t run in a process, '
+                        f'another function of the same name is defined')
+    from .bot import AioTomon
+    if any(isinstance(v, AioTomon) for v in list(vars(module).values())):
+        # e.g. `bot = get_bot()`, which fails in a fresh process
+        raise TypeError(f'{module.__name__}.{qualname} can\'t run in a process, '
+                        f'its module needs the bot on import, move it to a helper module')
+
+
+class Offloader:
+    '''
+    Run sync functions on a thread pool or a process pool owned by the bot,
+    the pools are created on first use
+
+    :threads: max workers of the thread pool, None means the default
+    :processes: max workers of the process pool, None means the cpu count
+    '''
+
+    def __init__(self, threads: Optional[int] = None,
+                 processes: Optional[int] = None):
+        self._threads = threads
+        self._processes = processes
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        # Handlers to run in the process pool, checked once they are bound
+        self._process_funcs: List[Callable] = []
+
+    def _pool(self, process: bool) -> Executor:
+        if process:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(self._processes)
+            return self._process_pool
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(self._threads,
+                                                   thread_name_prefix='aiotomon')
+        return self._thread_pool
+
+    async def run(self, func: Callable[..., Any], *args,
+                  process: bool = False, **kwargs) -> Any:
+        return await asyncio.get_event_loop().run_in_executor(
+            self._pool(process), functools.partial(func, *args, **kwargs))
+
+    def wrap(self, func: Callable[..., Any]) -> Callable[..., Awaitable[Any]]:
+        '''
+        Turn a sync function into a coroutine function running it offloaded
+        '''
+        spec = getattr(func, '__aiotomon_offload__', None) or Offload()
+        semaphore: Optional[asyncio.Semaphore] = None
+        if spec.process:
+            self._process_funcs.append(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs) -> Any:
+            nonlocal semaphore
+            if not spec.concurrency:
+                return await self.run(func, *args, process=spec.process, **kwargs)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(spec.concurrency)
+            async with semaphore:
+                return await self.run(func, *args, process=spec.process, **kwargs)
+
+        return wrapper
+
+    def check(self) -> None:
+        '''
+        Raise TypeError if a process handler can't be pickled, e.g. its
+        name was bound to another function after it was decorated
+        '''
+        for func in self._process_funcs:
+            try:
+                pickle.dumps(func)
+            except (pickle.PicklingError, AttributeError, TypeError) as e:
+                raise TypeError(f'{func.__module__}.{func.__qualname__} can\'t run '
+                                f'in a process: {e}') from None
+
+    def shutdown(self) -> None:
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False)
+        self._thread_pool = self._process_pool = None
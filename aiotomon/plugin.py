@@ -1,33 +1,141 @@
 
 import os
+import json
+import time
 import importlib
+from typing import Any, Dict, List, Optional, Tuple
 
 
 class Plugins:
+    '''
+    A plugin package may declare the events it handles in a `manifest.json`,
+    e.g. `{"events": ["message.channel"]}`. Such a plugin is only imported
+    when one of the events (or a sub event of it) first arrives
+    '''
+
+    MANIFEST = 'manifest.json'
 
     def __init__(self, plugins_dir: str):
         self._plugin_dir = plugins_dir
         self._loads = set()
         self._not_loads = set()
+        # Module name -> the declared events of a plugin not imported yet
+        self._lazy: Dict[str, Tuple[str, ...]] = {}
+        # Module name -> import time, lazy or not, startup hooks
+        self._report: Dict[str, Dict[str, Any]] = {}
 
     def auto_load_plugins(self) -> None:
-        plugins = [i for i in os.listdir(self._plugin_dir)
-                   if os.path.isdir(f'{self._plugin_dir}/{i}')]
+        with os.scandir(self._plugin_dir) as entries:
+            plugins = sorted(i.name for i in entries if i.is_dir())
         for plugin in plugins:
-            if plugin in self._not_loads:
+            if plugin in self._not_loads or plugin.startswith(('.', '__')):
+                continue
+            events = self._manifest_events(plugin)
+            if events:
+                module_name = '{}.{}'.format(self._plugin_dir, plugin)
+                self._lazy[module_name] = events
+                self._entry(module_name)['lazy'] = True
                 continue
-            module = importlib.import_module(
-                '{}.{}'.format(self._plugin_dir, plugin))
-            self._loads.add(module.__name__)
+            self.load_plugins(plugin)
+
+    def _manifest_events(self, plugin: str) -> Tuple[str, ...]:
+        path = f'{self._plugin_dir}/{plugin}/{self.MANIFEST}'
+        if not os.path.isfile(path):
+            return ()
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if not manifest.get('lazy', True):
+            return ()
+        return tuple(manifest.get('events') or ())
 
     def load_plugins(self, module_name: str) -> None:
-        module = importlib.import_module(
-            '{}.{}'.format(self._plugin_dir, module_name))
+        self._import('{}.{}'.format(self._plugin_dir, module_name))
+
+    def _import(self, module_name: str) -> None:
+        begin = time.perf_counter()
+        module = importlib.import_module(module_name)
+        self._entry(module.__name__)['import'] = time.perf_counter() - begin
+        self._lazy.pop(module.__name__, None)
         self._loads.add(module.__name__)
 
     def not_load_plugins(self, module_name: str) -> None:
         self._not_loads.add(module_name)
 
+    def wants(self, event_name: str) -> bool:
+        '''
+        Whether a plugin not imported yet handles `event_name`
+        '''
+        return any(_matches(event_name, events) for events in self._lazy.values())
+
+    def load_for(self, event_name: str) -> List[str]:
+        '''
+        Import the lazy plugins handling `event_name`, the new ones are returned
+        '''
+        if not self._lazy:
+            return []
+        pending = [name for name, events in self._lazy.items()
+                   if _matches(event_name, events)]
+        for module_name in pending:
+            self._import(module_name)
+        return pending
+
+    def load_lazy(self, module_name: str) -> bool:
+        '''
+        Import the lazy plugin `module_name`, False if it's already imported
+        '''
+        if module_name not in self._lazy:
+            return False
+        self._import(module_name)
+        return True
+
+    def _entry(self, module_name: str) -> Dict[str, Any]:
+        entry = self._report.get(module_name)
+        if entry is None:
+            entry = self._report[module_name] = {'lazy': False, 'import': None, 'hooks': {}}
+        return entry
+
+    def record_hook(self, module_name: str, hook: str, cost: float, status: str) -> None:
+        '''
+        Record a startup hook of the plugin `module_name` belongs to
+        '''
+        plugin = self.owner(module_name)
+        if plugin is not None:
+            self._entry(plugin)['hooks'][hook] = {'time': cost, 'status': status}
+
     @property
     def plugins_info(self) -> set:
         return self._loads
+
+    @property
+    def lazy_plugins(self) -> Dict[str, Tuple[str, ...]]:
+        return dict(self._lazy)
+
+    @property
+    def startup_report(self) -> Dict[str, Dict[str, Any]]:
+        '''
+        Per plugin: `import` seconds (None while lazy and not imported),
+        `lazy`, and time and status of every startup hook, `total` sums them
+        '''
+        report = {}
+        for name, entry in self._report.items():
+            hooks = {k: dict(v) for k, v in entry['hooks'].items()}
+            report[name] = {
+                'lazy': entry['lazy'],
+                'import': entry['import'],
+                'hooks': hooks,
+                'total': (entry['import'] or 0.0) + sum(h['time'] for h in hooks.values())
+            }
+        return report
+
+    def owner(self, module_name: str) -> Optional[str]:
+        '''
+        The loaded plugin which `module_name` belongs to
+        '''
+        for name in self._loads:
+            if module_name == name or module_name.startswith(name + '.'):
+                return name
+        return None
+
+
+def _matches(event_name: str, events: Tuple[str, ...]) -> bool:
+    return any(event_name == e or event_name.startswith(e + '.') for e in events)
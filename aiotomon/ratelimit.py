@@ -0,0 +1,195 @@
+
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Optional, Dict, Mapping, Tuple
+
+from .exceptions import RateLimitRejected
+
+# Route buckets without a configured rate only honour the server headers
+_UNLIMITED_RATE = 1e6
+
+
+class TokenBucket:
+    '''
+    Token bucket, waiters are served in FIFO order
+    '''
+
+    __slots__ = ('rate', 'capacity', '_tokens', '_updated', '_blocked_until', '_lock')
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def block(self, seconds: float) -> None:
+        '''
+        No token will be handed out in the next `seconds`
+        '''
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens = 0.0
+        self._blocked_until = max(self._blocked_until, now + seconds)
+
+    @property
+    def idle(self) -> bool:
+        return self._lock is None or not self._lock.locked()
+
+    async def acquire(self) -> bool:
+        '''
+        Take one token, return whether the caller had to wait
+        '''
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        waited = False
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    wait = (1 - self._tokens) / self.rate
+                waited = True
+                await asyncio.sleep(wait)
+
+
+class RateLimiter:
+    '''
+    Client-side rate limit of outgoing api calls
+
+    Every call takes a token from its route bucket (keyed by the request path,
+    i.e. one bucket per channel for `/channels/{channelId}/messages`) and then
+    from the global bucket. The buckets are adjusted by the rate limit headers
+    of the responses.
+
+    :global_rate: requests per second of all routes, None means no limit
+    :route_rate: requests per second of a single route, None means no limit
+    :max_queue: max number of waiting calls, 0 means unbounded
+    :max_buckets: max number of route buckets kept in memory
+    '''
+
+    def __init__(self, global_rate: Optional[float] = None,
+                 route_rate: Optional[float] = None, *,
+                 max_queue: int = 0,
+                 max_buckets: int = 1024):
+        self._global = TokenBucket(global_rate) if global_rate else None
+        self._route_rate = route_rate
+        self._max_queue = max_queue
+        self._max_buckets = max_buckets
+        self._buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+
+        self._queued = 0
+        self._delayed = 0
+        self._rejected = 0
+
+    def _bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self._route_rate or _UNLIMITED_RATE)
+            if len(self._buckets) > self._max_buckets:
+                self._evict()
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _evict(self) -> None:
+        '''
+        Drop the least recently used idle buckets down to `max_buckets`,
+        busy ones are skipped since calls are waiting on them
+        '''
+        excess = len(self._buckets) - self._max_buckets
+        evicted = []
+        for key, bucket in self._buckets.items():
+            if len(evicted) >= excess:
+                break
+            if bucket.idle:
+                evicted.append(key)
+        for key in evicted:
+            del self._buckets[key]
+
+    async def acquire(self, key: str) -> None:
+        if self._max_queue and self._queued >= self._max_queue:
+            self.reject()
+            raise RateLimitRejected()
+
+        self._queued += 1
+        try:
+            waited = False
+            if self._route_rate or key in self._buckets:
+                waited = await self._bucket(key).acquire()
+            if self._global:
+                waited = await self._global.acquire() or waited
+        finally:
+            self._queued -= 1
+
+        if waited:
+            self._delayed += 1
+
+    def update(self, key: str, status: int, headers: Mapping[str, str]) -> float:
+        '''
+        Read rate limit headers of a response, return the seconds to wait
+        before the route can be called again
+        '''
+        delay, is_global = parse_headers(status, headers)
+        if delay > 0:
+            self.block(key, delay, is_global)
+        return delay
+
+    def block(self, key: str, delay: float, is_global: bool = False) -> None:
+        if is_global:
+            if self._global is None:
+                # Without a global rate only the server headers limit all calls
+                self._global = TokenBucket(_UNLIMITED_RATE)
+            self._global.block(delay)
+        else:
+            self._bucket(key).block(delay)
+
+    def reject(self) -> None:
+        self._rejected += 1
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        '''
+        :queued: calls waiting for a token right now
+        :delayed: calls that had to wait for a token
+        :rejected: calls given up because of the rate limit
+        '''
+        return {
+            'queued': self._queued,
+            'delayed': self._delayed,
+            'rejected': self._rejected
+        }
+
+
+def parse_headers(status: int, headers: Mapping[str, str]) -> Tuple[float, bool]:
+    '''
+    Seconds to wait according to the response, and whether it's a global limit
+    '''
+    delay = 0.0
+    retry_after = headers.get('Retry-After')
+    if status == 429 and retry_after:
+        delay = _to_float(retry_after)
+    elif headers.get('X-RateLimit-Remaining') == '0':
+        delay = _to_float(headers.get('X-RateLimit-Reset-After'))
+    if status == 429 and delay <= 0:
+        delay = 1.0
+    return delay, bool(status == 429 and headers.get('X-RateLimit-Global'))
+
+
+def _to_float(value: Optional[str]) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
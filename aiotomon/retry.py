@@ -0,0 +1,198 @@
+
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+import aiohttp
+
+from .backoff import Backoff
+from .exceptions import CircuitOpenError, HttpFailed, RateLimitRejected
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class CircuitBreaker:
+    '''
+    Fail fast while the api is down: `threshold` failed calls in a row
+    (after their retries) open the circuit, after `reset_timeout` seconds one call is let through to probe
+    the api, its success closes the circuit again
+
+    :threshold: failed calls in a row opening the circuit, 0 disables it
+    '''
+
+    CLOSED = 'closed'
+
+    OPEN = 'open'
+
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30):
+        self._threshold = threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self._reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self._rejected += 1
+        return False
+
+    def success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def failure(self) -> None:
+        self._failures += 1
+        self._probing = False
+        if self._threshold and (self._opened_at is not None or
+                                self._failures >= self._threshold):
+            self._opened_at = time.monotonic()
+
+    def release(self, failed: bool = True) -> None:
+        '''
+        End a call which tells nothing about the api, e.g. a cancelled one.
+        A probe that didn't succeed still counts as a failure, the circuit
+        is opened again instead of waiting for a probe that never ends
+
+        :failed: False only frees the probe slot, e.g. for a call which
+                 never reached the api
+        '''
+        if self._probing:
+            if failed:
+                self.failure()
+            else:
+                self._probing = False
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'state': self.state,
+            'failures': self._failures,
+            'rejected': self._rejected
+        }
+
+
+class RetryPolicy:
+    '''
+    Retry the attempts of a call with jittered exponential backoff until
+    `retries` or the deadline runs out
+
+    Non-idempotent calls, e.g. a POST without a nonce, are only retried
+    when the connection couldn't be opened, the request was never sent
+
+    :retries: max retries after the first attempt
+    :deadline: seconds for all the attempts of a call, None means no deadline
+    :statuses: http statuses worth retrying
+    '''
+
+    def __init__(self, retries: int = 3, *,
+                 backoff_base: float = 0.5,
+                 backoff_cap: float = 8,
+                 deadline: Optional[float] = None,
+                 statuses: Iterable[int] = RETRY_STATUSES,
+                 breaker: Optional[CircuitBreaker] = None,
+                 log: Optional[logging.Logger] = None):
+        self._retries = retries
+        self._backoff_base = backoff_base
+        self._backoff_cap = backoff_cap
+        self._deadline = deadline
+        self._statuses = frozenset(statuses)
+        self._breaker = breaker or CircuitBreaker(0)
+        self._log = log or logging.getLogger(__name__)
+        self._retried = 0
+
+    def retryable(self, exc: BaseException, idempotent: bool) -> bool:
+        if isinstance(exc, aiohttp.ClientConnectorError):
+            return True
+        if not idempotent:
+            return False
+        if isinstance(exc, HttpFailed):
+            return exc.status in self._statuses
+        return isinstance(exc, (aiohttp.ClientConnectionError,
+                                aiohttp.ClientPayloadError,
+                                asyncio.TimeoutError))
+
+    @staticmethod
+    def is_failure(exc: BaseException) -> bool:
+        '''
+        Whether an error tells the api is unhealthy, which counts for the
+        circuit breaker, unlike client errors such as a 404
+        '''
+        if isinstance(exc, HttpFailed):
+            return exc.status >= 500
+        return isinstance(exc, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+    async def run(self, name: str, attempt: Callable[[Optional[float]], Awaitable[Any]],
+                  idempotent: bool, timeout: Optional[float] = None) -> Any:
+        '''
+        The circuit breaker counts the call once, after its last attempt
+
+        :attempt: sends the request once, called with its timeout
+        :timeout: timeout of a single attempt, capped by the remaining deadline
+        '''
+        if not self._breaker.allow():
+            raise CircuitOpenError(f'{name}: the api keeps failing, circuit open')
+        try:
+            result = await self._attempts(name, attempt, idempotent, timeout)
+        except BaseException as e:
+            # Cancellation included, the probe slot must not stay taken
+            self._settle(e)
+            raise
+        self._breaker.success()
+        return result
+
+    async def _attempts(self, name: str, attempt: Callable[[Optional[float]], Awaitable[Any]],
+                        idempotent: bool, timeout: Optional[float]) -> Any:
+        deadline = time.monotonic() + self._deadline if self._deadline else None
+        backoff = Backoff(self._backoff_base, self._backoff_cap)
+        tries = 0
+        while True:
+            attempt_timeout = timeout
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                attempt_timeout = remaining if timeout is None else min(timeout, remaining)
+            try:
+                return await attempt(attempt_timeout)
+            except Exception as e:
+                if tries >= self._retries or not self.retryable(e, idempotent):
+                    raise
+                delay = backoff.next()
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+                tries += 1
+                self._retried += 1
+                self._log.warning(f'{name} 请求失败（{e!r}），{delay:.2f} 秒后第 {tries} 次重试')
+            await asyncio.sleep(delay)
+
+    def _settle(self, exc: BaseException) -> None:
+        if isinstance(exc, RateLimitRejected):
+            # Given up locally, the api was never asked
+            self._breaker.release(failed=False)
+        elif self.is_failure(exc):
+            self._breaker.failure()
+        elif isinstance(exc, HttpFailed):
+            # The api answered, it is up
+            self._breaker.success()
+        else:
+            self._breaker.release()
+
+    @property
+    def stats(self) -> dict:
+        return dict(self._breaker.stats, retried=self._retried)
@@ -0,0 +1,274 @@
+
+import time
+import zlib
+import asyncio
+import logging
+import multiprocessing
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from .backoff import Backoff
+from .exceptions import HttpFailed, RateLimitRejected
+from .ratelimit import RateLimiter, parse_headers
+
+
+def shard_of(key: Any, shard_count: int) -> int:
+    '''
+    The shard an id belongs to, snowflake ids are spread by their value
+    '''
+    key = str(key)
+    if key.isdigit():
+        return int(key) % shard_count
+    return zlib.crc32(key.encode()) % shard_count
+
+
+class RateLimitServer:
+    '''
+    Share one `RateLimiter` among the shard processes over a local socket
+
+    Line protocol:
+        `A <id> <key>` acquire a token of `key`, answered by `OK <id>` or
+                       `RJ <id>` when rejected
+        `B <seconds> <global> <key>` block `key` (or the global bucket)
+    '''
+
+    def __init__(self, limiter: RateLimiter):
+        self._limiter = limiter
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> Tuple[str, int]:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                cmd, _, args = line.decode().rstrip('\n').partition(' ')
+                if cmd == 'A':
+                    id_, key = args.split(' ', 1)
+                    task = asyncio.ensure_future(self._acquire(writer, id_, key))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                elif cmd == 'B':
+                    delay, is_global, key = args.split(' ', 2)
+                    self._limiter.block(key, float(delay), is_global == '1')
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _acquire(self, writer: asyncio.StreamWriter, id_: str, key: str) -> None:
+        try:
+            await self._limiter.acquire(key)
+            writer.write(f'OK {id_}\n'.encode())
+        except HttpFailed:
+            writer.write(f'RJ {id_}\n'.encode())
+
+
+class RemoteRateLimiter:
+    '''
+    Client of `RateLimitServer` with the interface of `RateLimiter`, falls
+    back to a local limiter when the server can't be reached
+    '''
+
+    def __init__(self, address: Tuple[str, int], fallback: RateLimiter,
+                 log: Optional[logging.Logger] = None):
+        self._address = address
+        self._fallback = fallback
+        self._log = log or logging.getLogger(__name__)
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connecting: Optional[asyncio.Future] = None
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._next_id = 0
+        self._broken = False
+
+        self._queued = 0
+        self._delayed = 0
+        self._rejected = 0
+
+    async def _connect(self) -> None:
+        reader, self._writer = await asyncio.open_connection(*self._address)
+        asyncio.ensure_future(self._read(reader))
+
+    async def _read(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                status, id_ = line.decode().split()
+                waiter = self._waiters.pop(id_, None)
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(status == 'OK')
+        finally:
+            self._break()
+
+    def _break(self) -> None:
+        if not self._broken:
+            self._log.warning('限流协调进程连接断开，改用本进程限流')
+        self._broken = True
+        self._writer = None
+        for waiter in self._waiters.values():
+            if not waiter.done():
+                waiter.set_exception(ConnectionError)
+        self._waiters.clear()
+
+    async def acquire(self, key: str) -> None:
+        if self._broken:
+            return await self._fallback.acquire(key)
+        try:
+            if self._writer is None:
+                if self._connecting is None:
+                    self._connecting = asyncio.ensure_future(self._connect())
+                await asyncio.shield(self._connecting)
+
+            self._next_id += 1
+            id_ = str(self._next_id)
+            waiter = self._waiters[id_] = asyncio.get_event_loop().create_future()
+            self._writer.write(f'A {id_} {key}\n'.encode())
+
+            self._queued += 1
+            begin = time.monotonic()
+            try:
+                ok = await waiter
+            finally:
+                self._queued -= 1
+        except (OSError, ConnectionError):
+            self._break()
+            return await self._fallback.acquire(key)
+
+        if time.monotonic() - begin > 0.001:
+            self._delayed += 1
+        if not ok:
+            self.reject()
+            raise RateLimitRejected()
+
+    def update(self, key: str, status: int, headers: Mapping[str, str]) -> float:
+        if self._broken or self._writer is None:
+            return self._fallback.update(key, status, headers)
+        delay, is_global = parse_headers(status, headers)
+        if delay > 0:
+            self._writer.write(f'B {delay} {int(is_global)} {key}\n'.encode())
+        return delay
+
+    def reject(self) -> None:
+        self._rejected += 1
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queued': self._queued,
+            'delayed': self._delayed,
+            'rejected': self._rejected
+        }
+
+
+def _run_shard(factory: Callable[[], Any], shard_id: int, shard_count: int,
+               address: Optional[Tuple[str, int]]) -> None:
+    bot = factory()
+    bot.set_shard(shard_id, shard_count)
+    if address is not None:
+        bot._api.set_rate_limiter(
+            RemoteRateLimiter(address, bot._api._limiter, log=bot.log))
+    bot.run()
+
+
+class ShardRunner:
+    '''
+    Run the bot as `shards` gateway connections, each one in its own process
+    with its own event loop and plugins. The supervisor restarts a shard
+    which exits and shares the outgoing rate limit among the shards.
+
+    :factory: importable function creating the bot of a shard, e.g. calls
+              `aiotomon.init` and loads the plugins
+    :rate_limit_global: requests per second of all shards, None means no limit
+    :rate_limit_route: requests per second of a single route of all shards
+    '''
+
+    def __init__(self, factory: Callable[[], Any], shards: int, *,
+                 rate_limit_global: Optional[float] = None,
+                 rate_limit_route: Optional[float] = None,
+                 restart_backoff_cap: float = 60):
+        self._factory = factory
+        self._shards = shards
+        self._limiter = RateLimiter(rate_limit_global, rate_limit_route)
+        self._restart_backoff_cap = restart_backoff_cap
+        self._ctx = multiprocessing.get_context('spawn')
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * shards
+        self._restarts = [0] * shards
+
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s - %(levelname)s - %(message)s',
+                            datefmt='%Y-%m-%d %H:%M:%S')
+        self._log = logging.getLogger(__name__)
+
+    def _spawn(self, shard_id: int, address: Tuple[str, int]) -> None:
+        process = self._ctx.Process(
+            target=_run_shard,
+            args=(self._factory, shard_id, self._shards, address),
+            name=f'aiotomon-shard-{shard_id}')
+        process.start()
+        self._processes[shard_id] = process
+        self._log.info(f'分片 {shard_id}/{self._shards} 已启动 (pid {process.pid})')
+
+    async def _supervise(self) -> None:
+        server = RateLimitServer(self._limiter)
+        address = await server.start()
+        backoffs = [Backoff(1, self._restart_backoff_cap) for _ in range(self._shards)]
+        started_at = [0.0] * self._shards
+        restart_at: Dict[int, float] = {}
+        try:
+            for shard_id in range(self._shards):
+                self._spawn(shard_id, address)
+                started_at[shard_id] = time.monotonic()
+
+            while True:
+                now = time.monotonic()
+                for shard_id, process in enumerate(self._processes):
+                    if shard_id in restart_at:
+                        if now >= restart_at[shard_id]:
+                            del restart_at[shard_id]
+                            self._restarts[shard_id] += 1
+                            self._spawn(shard_id, address)
+                            started_at[shard_id] = now
+                        continue
+                    if process.is_alive():
+                        continue
+                    if now - started_at[shard_id] > self._restart_backoff_cap:
+                        backoffs[shard_id].reset()
+                    delay = backoffs[shard_id].next()
+                    self._log.warning(f'分片 {shard_id} 已退出（退出码 {process.exitcode}），'
+                                      f'{delay:.2f} 秒后重启')
+                    restart_at[shard_id] = now + delay
+                await asyncio.sleep(0.5)
+        finally:
+            await server.close()
+
+    def stop(self) -> None:
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            if process is not None:
+                process.join(5)
+
+    @property
+    def restarts(self) -> List[int]:
+        return list(self._restarts)
+
+    def run(self) -> None:
+        try:
+            asyncio.run(self._supervise())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
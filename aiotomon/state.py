@@ -0,0 +1,361 @@
+
+import copy
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Type, TypeVar
+
+from .api_func import ChannelApi
+
+R = TypeVar('R', bound='Record')
+
+
+class Record:
+    '''
+    Compact copy of the fields of an entity the cache keeps, unknown
+    fields of the payloads are not kept. An entity which can be served in
+    place of an http call also keeps the whole response (or the gateway
+    payload in the same shape), which is returned on a cache hit
+    '''
+
+    __slots__ = ('_response',)
+
+    def __init__(self, **fields):
+        self._response: Optional[Dict[str, Any]] = None
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_dict(cls: Type[R], d: Dict[str, Any]) -> R:
+        record = cls.__new__(cls)
+        record._response = None
+        for name in cls.__slots__:
+            setattr(record, name, d.get(name))
+        return record
+
+    def update(self, d: Dict[str, Any]) -> None:
+        for name in self.__slots__:
+            if name in d:
+                setattr(self, name, d[name])
+        response = self._response
+        if response is not None:
+            for key in response.keys() & d.keys():
+                response[key] = copy.deepcopy(d[key])
+
+    def keep_response(self, response: Dict[str, Any]) -> None:
+        self._response = copy.deepcopy(response)
+
+    def response(self) -> Optional[Dict[str, Any]]:
+        '''
+        A copy of the kept response with the later updates, None if there
+        is none
+        '''
+        if self._response is None:
+            return None
+        return copy.deepcopy(self._response)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__
+                if getattr(self, name) is not None}
+
+    def __repr__(self) -> str:
+        return f'<{type(self).__name__} {self.to_dict()}>'
+
+
+class User(Record):
+
+    __slots__ = ('id', 'username', 'discriminator', 'name', 'avatar',
+                 'avatar_url', 'type')
+
+
+class Member(Record):
+    '''
+    The user of a member is kept in the user cache and only linked by id
+    '''
+
+    __slots__ = ('guild_id', 'user_id', 'nick', 'roles', 'joined_at')
+
+
+class Channel(Record):
+
+    __slots__ = ('id', 'guild_id', 'name', 'type', 'topic', 'position', 'parent_id')
+
+
+class Role(Record):
+
+    __slots__ = ('id', 'guild_id', 'name', 'color', 'permissions', 'position',
+                 'hoist', 'mentionable')
+
+
+class Guild(Record):
+
+    __slots__ = ('id', 'name', 'icon', 'owner_id', 'position', 'joined_at')
+
+
+class LRU:
+    '''
+    Dict with a size cap evicting the least recently used entry, a cap of
+    0 keeps nothing and None means unbounded
+    '''
+
+    __slots__ = ('_items', '_cap')
+
+    def __init__(self, cap: Optional[int]):
+        self._items: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._cap = cap
+
+    def get(self, key: Hashable) -> Any:
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self._cap == 0:
+            return
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if self._cap is not None and len(self._items) > self._cap:
+            self._items.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Any:
+        return self._items.pop(key, None)
+
+    def drop(self, match: Callable[[Any], bool]) -> None:
+        for key in [k for k, v in self._items.items() if match(v)]:
+            del self._items[key]
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+def _user_id(d: Dict[str, Any]) -> Optional[str]:
+    user = d.get('user')
+    if isinstance(user, dict):
+        return user.get('id')
+    return d.get('user_id')
+
+
+class State:
+    '''
+    Users, members, channels, roles and guilds kept up to date by the
+    gateway events, each type is capped on its own
+
+    :max_*: max entities of the type, None means unbounded
+    '''
+
+    def __init__(self, max_users: Optional[int] = 10000,
+                 max_members: Optional[int] = 50000,
+                 max_channels: Optional[int] = 10000,
+                 max_roles: Optional[int] = 10000,
+                 max_guilds: Optional[int] = 1000):
+        self.users = LRU(max_users)
+        # (guild id, user id) -> Member
+        self.members = LRU(max_members)
+        self.channels = LRU(max_channels)
+        self.roles = LRU(max_roles)
+        self.guilds = LRU(max_guilds)
+        self.me: Optional[User] = None
+
+        self._hits = 0
+        self._misses = 0
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {
+            'GUILD_CREATE': self._put_guild,
+            'GUILD_UPDATE': self._put_guild,
+            'GUILD_DELETE': self._remove_guild,
+            'CHANNEL_CREATE': self._put_channel,
+            'CHANNEL_UPDATE': self._put_channel,
+            'CHANNEL_DELETE': self._remove_channel,
+            'GUILD_ROLE_CREATE': self._put_role,
+            'GUILD_ROLE_UPDATE': self._put_role,
+            'GUILD_ROLE_DELETE': self._remove_role,
+            'GUILD_MEMBER_ADD': self._put_member,
+            'GUILD_MEMBER_UPDATE': self._put_member,
+            'GUILD_MEMBER_REMOVE': self._remove_member,
+        }
+
+    def apply(self, event_type: Optional[str], d: Any) -> None:
+        '''
+        Update the cache with a gateway event, other events are ignored
+        '''
+        handler = self._handlers.get(event_type)
+        if handler is None or not isinstance(d, dict):
+            return
+        try:
+            handler(d)
+        except (AttributeError, KeyError, TypeError):
+            # A payload of an unexpected shape just isn't cached
+            pass
+
+    def _put(self, lru: LRU, key: Hashable, cls: Type[R], d: Dict[str, Any]) -> R:
+        record = lru.get(key)
+        if record is None:
+            record = cls.from_dict(d)
+            lru.put(key, record)
+        else:
+            record.update(d)
+        return record
+
+    def put_user(self, d: Dict[str, Any]) -> User:
+        user = self._put(self.users, d['id'], User, d)
+        if self.me is not None and self.me.id == user.id:
+            self.me.update(d)
+        return user
+
+    def set_me(self, d: Dict[str, Any]) -> None:
+        self.me = User.from_dict(d)
+
+    def _put_guild(self, d: Dict[str, Any]) -> None:
+        self._put(self.guilds, d['id'], Guild, d)
+        for channel in d.get('channels') or ():
+            self._put_channel(dict(channel, guild_id=channel.get('guild_id', d['id'])))
+        for role in d.get('roles') or ():
+            self._put_role(dict(role, guild_id=role.get('guild_id', d['id'])))
+        for member in d.get('members') or ():
+            self._put_member(dict(member, guild_id=member.get('guild_id', d['id'])))
+
+    def _remove_guild(self, d: Dict[str, Any]) -> None:
+        guild_id = d.get('id') or d.get('guild_id')
+        self.guilds.pop(guild_id)
+
+        def in_guild(record: Record) -> bool:
+            return record.guild_id == guild_id
+
+        self.channels.drop(in_guild)
+        self.roles.drop(in_guild)
+        self.members.drop(in_guild)
+
+    def _put_channel(self, d: Dict[str, Any]) -> None:
+        self._put(self.channels, d['id'], Channel, d)
+
+    def _remove_channel(self, d: Dict[str, Any]) -> None:
+        self.channels.pop(d.get('id'))
+
+    def _put_role(self, d: Dict[str, Any]) -> None:
+        role = d.get('role')
+        if isinstance(role, dict):
+            d = dict(role, guild_id=role.get('guild_id', d.get('guild_id')))
+        self._put(self.roles, d['id'], Role, d)
+
+    def _remove_role(self, d: Dict[str, Any]) -> None:
+        role = d.get('role')
+        self.roles.pop(role.get('id') if isinstance(role, dict) else d.get('id', d.get('role_id')))
+
+    def put_member(self, guild_id: str, d: Dict[str, Any],
+                   response: Optional[Dict[str, Any]] = None) -> Member:
+        '''
+        :response: the http response of the member, by default the payload
+            is kept as one if it embeds the user like the api does
+        '''
+        user = d.get('user')
+        if isinstance(user, dict):
+            self.put_user(user)
+        user_id = _user_id(d)
+        member = self._put(self.members, (guild_id, user_id), Member,
+                           dict(d, guild_id=guild_id, user_id=user_id))
+        if response is None and member._response is None and isinstance(user, dict):
+            # The api answers without the ids the gateway adds
+            response = {k: v for k, v in d.items() if k not in ('guild_id', 'user_id')}
+        if response is not None:
+            member.keep_response(response)
+        return member
+
+    def member_response(self, member: Member) -> Optional[Dict[str, Any]]:
+        '''
+        The kept response of a member, its user up to date with the user cache
+        '''
+        response = member.response()
+        if response is None:
+            return None
+        user = response.get('user')
+        record = self.users.get(member.user_id)
+        if isinstance(user, dict) and record is not None:
+            for name in User.__slots__:
+                if name in user:
+                    user[name] = getattr(record, name)
+        return response
+
+    def _put_member(self, d: Dict[str, Any]) -> None:
+        self.put_member(d['guild_id'], d)
+
+    def _remove_member(self, d: Dict[str, Any]) -> None:
+        self.members.pop((d.get('guild_id'), _user_id(d)))
+
+    def get_user(self, user_id: str) -> Optional[User]:
+        return self._count(self.users.get(user_id))
+
+    def get_member(self, guild_id: str, user_id: str) -> Optional[Member]:
+        return self._count(self.members.get((guild_id, user_id)))
+
+    def get_channel(self, channel_id: str) -> Optional[Channel]:
+        return self._count(self.channels.get(channel_id))
+
+    def get_role(self, role_id: str) -> Optional[Role]:
+        return self._count(self.roles.get(role_id))
+
+    def get_guild(self, guild_id: str) -> Optional[Guild]:
+        return self._count(self.guilds.get(guild_id))
+
+    def _count(self, record: Optional[R]) -> Optional[R]:
+        if record is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return record
+
+    def install(self, api: Any) -> None:
+        '''
+        Serve the GET actions of `api` from the cache first, a miss goes
+        over http and fills the cache. A hit returns the fields of the api
+        response, members pushed by the gateway are served as well.
+        `cache=False` skips the cache
+        '''
+        fetch_me = api._actions[ChannelApi.get_user_info]
+        fetch_member = api._actions[ChannelApi.get_channel_user_info]
+
+        async def get_user_info(cache: bool = True, **params) -> Any:
+            response = self.me.response() if cache and self.me is not None else None
+            if response is not None:
+                self._hits += 1
+                return response
+            self._misses += 1
+            result = await fetch_me(cache=cache, **params)
+            if isinstance(result, dict) and 'id' in result:
+                self.set_me(result)
+                self.me.keep_response(result)
+            return result
+
+        async def get_channel_user_info(cache: bool = True, **params) -> Any:
+            gid, uid = params.get('gid'), params.get('uid')
+            if cache and gid and uid:
+                member = self.members.get((gid, uid))
+                response = self.member_response(member) if member is not None else None
+                if response is not None:
+                    self._hits += 1
+                    return response
+                self._misses += 1
+            result = await fetch_member(cache=cache, **params)
+            if isinstance(result, dict) and gid and uid:
+                self.put_member(gid, dict(result, user_id=uid), response=result)
+            return result
+
+        api.register_action(ChannelApi.get_user_info, get_user_info)
+        api.register_action(ChannelApi.get_channel_user_info, get_channel_user_info)
+
+    def clear(self) -> None:
+        for lru in (self.users, self.members, self.channels, self.roles, self.guilds):
+            lru.clear()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            'users': len(self.users),
+            'members': len(self.members),
+            'channels': len(self.channels),
+            'roles': len(self.roles),
+            'guilds': len(self.guilds),
+            'hits': self._hits,
+            'misses': self._misses
+        }
+
@@ -0,0 +1,131 @@
+
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+from websockets.extensions.base import Extension
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
+from websockets.frames import CTRL_OPCODES, Frame
+
+
+class Compression:
+
+    # permessage-deflate with the tuned window and memory settings
+    DEFLATE = 'deflate'
+
+    # the gateway compresses all frames as one zlib stream
+    ZLIB_STREAM = 'zlib-stream'
+
+
+# Every complete message of a zlib stream ends with a Z_SYNC_FLUSH
+ZLIB_SUFFIX = b'\x00\x00\xff\xff'
+
+
+class ZlibStream:
+    '''
+    Inflate the binary frames of a zlib stream, one context per connection
+    '''
+
+    __slots__ = ('_inflator', '_buffer')
+
+    def __init__(self):
+        self._inflator = zlib.decompressobj()
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> Optional[bytes]:
+        '''
+        Return the inflated message once it's complete, otherwise None
+        '''
+        self._buffer += data
+        if len(data) < 4 or data[-4:] != ZLIB_SUFFIX:
+            return None
+        message = self._inflator.decompress(self._buffer)
+        self._buffer.clear()
+        return message
+
+
+class WireCounter(Extension):
+    '''
+    Wrap the negotiated permessage-deflate extension to count the
+    compressed size of the data frames before websockets inflates them
+    '''
+
+    def __init__(self, extension: Extension, stats: 'GatewayStats'):
+        self.name = extension.name
+        self._extension = extension
+        self._stats = stats
+
+    def decode(self, frame: Frame, *, max_size: Optional[int] = None) -> Frame:
+        if frame.opcode not in CTRL_OPCODES:
+            self._stats.bytes_in += len(frame.data)
+        return self._extension.decode(frame, max_size=max_size)
+
+    def encode(self, frame: Frame) -> Frame:
+        return self._extension.encode(frame)
+
+
+class CountingDeflateFactory(ClientPerMessageDeflateFactory):
+
+    def __init__(self, stats: 'GatewayStats', **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    def process_response_params(self, params, accepted_extensions) -> Extension:
+        extension = super().process_response_params(params, accepted_extensions)
+        return WireCounter(extension, self._stats)
+
+
+def counts_wire(websocket: Any) -> bool:
+    '''
+    Whether the frames of `websocket` are counted by a `WireCounter`, i.e.
+    the gateway accepted permessage-deflate
+    '''
+    protocol = getattr(websocket, 'protocol', websocket)
+    return any(isinstance(e, WireCounter) for e in getattr(protocol, 'extensions', ()))
+
+
+def connect_options(uri: str, compression: Optional[str], *,
+                    window_bits: Optional[int] = None,
+                    mem_level: Optional[int] = None,
+                    stats: Optional['GatewayStats'] = None) -> Tuple[str, Dict[str, Any]]:
+    '''
+    The uri and the keyword arguments of `websockets.connect`
+
+    :stats: counts the compressed bytes of permessage-deflate
+    '''
+    if compression is None:
+        return uri, {}
+
+    if compression == Compression.DEFLATE:
+        options = dict(
+            server_max_window_bits=window_bits,
+            client_max_window_bits=window_bits or True,
+            compress_settings={'memLevel': mem_level} if mem_level else None)
+        if stats is not None:
+            factory = CountingDeflateFactory(stats, **options)
+        else:
+            factory = ClientPerMessageDeflateFactory(**options)
+        return uri, {'compression': None, 'extensions': [factory]}
+
+    if compression == Compression.ZLIB_STREAM:
+        uri += ('&' if '?' in uri else '?') + 'compress=zlib-stream'
+        return uri, {'compression': None}
+
+    raise ValueError(f'Unknown gateway compression: {compression}')
+
+
+class GatewayStats:
+
+    __slots__ = ('frames', 'bytes_in', 'bytes_decoded')
+
+    def __init__(self):
+        self.frames = 0
+        # Size of the frames on the wire, before any inflating
+        self.bytes_in = 0
+        self.bytes_decoded = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            'frames': self.frames,
+            'bytes_in': self.bytes_in,
+            'bytes_decoded': self.bytes_decoded
+        }
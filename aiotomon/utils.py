@@ -1,13 +1,30 @@
 
 import os
+import asyncio
 import aiofiles
-from typing import Dict, Any
+import aiofiles.os
+from collections import OrderedDict
+from typing import Any, AsyncIterator, BinaryIO, Dict, Optional, Tuple
 
 from .exceptions import FileTypeError
 
 
+# Magic bytes -> (suffix, content type)
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', ('jpg', 'image/jpeg')),
+    (b'\x89PNG\r\n\x1a\n', ('png', 'image/png')),
+    (b'GIF87a', ('gif', 'image/gif')),
+    (b'GIF89a', ('gif', 'image/gif')),
+    (b'BM', ('bmp', 'image/bmp')),
+)
+
+
 class FileIO:
 
+    HEAD_SIZE = 16
+
+    CHUNK_SIZE = 64 * 1024
+
     @staticmethod
     async def read_image(path: str) -> bytes:
         if not os.path.exists(path):
@@ -16,15 +33,118 @@ class FileIO:
             return await f.read()
 
     @staticmethod
-    def get_file_info(file_path: str) -> Dict[str, str]:
-        file_name = file_path.rsplit(
-            '/', maxsplit=1)[-1] if '/' in file_path else file_path
-        suffix = file_name.rsplit('.', maxsplit=1)[-1]
-        if not any(i == suffix for i in {'jpg', 'png'}):
-            raise FileTypeError
+    async def read_head(path: str, size: int = HEAD_SIZE) -> bytes:
+        if not os.path.exists(path):
+            raise IOError
+        async with aiofiles.open(path, 'rb') as f:
+            return await f.read(size)
+
+    @staticmethod
+    async def stream(path: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        '''
+        Read a file chunk by chunk without buffering all of it
+        '''
+        async with aiofiles.open(path, 'rb') as f:
+            while True:
+                chunk = await f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    @staticmethod
+    async def stream_fileobj(fileobj: BinaryIO, offset: int,
+                             chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        '''
+        Read a sync file-like object from `offset` in the default executor,
+        the object stays open
+        '''
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, fileobj.seek, offset)
+        while True:
+            chunk = await loop.run_in_executor(None, fileobj.read, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    @staticmethod
+    def image_type(head: bytes) -> Tuple[str, str]:
+        '''
+        (suffix, content type) of an image detected by its magic bytes
+        '''
+        for signature, image_type in IMAGE_SIGNATURES:
+            if head.startswith(signature):
+                return image_type
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return 'webp', 'image/webp'
+        raise FileTypeError
+
+    @staticmethod
+    def get_file_info(file_path: str, head: Optional[bytes] = None) -> Dict[str, str]:
+        '''
+        :head: the first bytes of the file, read from `file_path` when None
+        '''
+        if head is None:
+            with open(file_path, 'rb') as f:
+                head = f.read(FileIO.HEAD_SIZE)
+        return {
+            'name': os.path.basename(file_path),
+            'content_type': FileIO.image_type(head)[1]
+        }
+
+
+class ImageCache:
+    '''
+    LRU cache of image files keyed by path, mtime and size, bounded by
+    the total bytes cached. A modified file misses and replaces its entry
+
+    :max_bytes: max total size, files larger than this are never cached
+    '''
+
+    def __init__(self, max_bytes: int):
+        self._max_bytes = max_bytes
+        self._size = 0
+        self._items: 'OrderedDict[str, Tuple[Tuple[int, int], bytes]]' = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    async def read(self, path: str) -> bytes:
+        path = os.path.abspath(path)
+        st = await aiofiles.os.stat(path)
+        version = (st.st_mtime_ns, st.st_size)
+        item = self._items.get(path)
+        if item is not None and item[0] == version:
+            self._items.move_to_end(path)
+            self._hits += 1
+            return item[1]
+
+        self._misses += 1
+        data = await FileIO.read_image(path)
+        self._put(path, version, data)
+        return data
+
+    def _put(self, path: str, version: Tuple[int, int], data: bytes) -> None:
+        old = self._items.pop(path, None)
+        if old is not None:
+            self._size -= len(old[1])
+        if len(data) > self._max_bytes:
+            return
+        self._items[path] = (version, data)
+        self._size += len(data)
+        while self._size > self._max_bytes:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self._size -= len(evicted)
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._size = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
         return {
-            'name': file_name,
-            'content_type': 'image/jpeg' if suffix == 'jpg' else 'image/png'
+            'items': len(self._items),
+            'bytes': self._size,
+            'hits': self._hits,
+            'misses': self._misses
         }
 
 
@@ -32,4 +152,7 @@ class Validate:
 
     @staticmethod
     def action(keys: set, params: Dict[str, Any]) -> bool:
-        return all(i in params and i != '' for i in keys)
+        '''
+        Whether every one of `keys` is given a non-empty value
+        '''
+        return all(params.get(i) not in ('', None) for i in keys)
@@ -0,0 +1,82 @@
+'''
+Decode cost per gateway frame for every installed json codec
+
+Frames are read from a file of recorded frames, one json frame per line:
+
+    python benchmark/codec.py frames.jsonl
+
+Without a file, synthetic frames shaped like the gateway events are used.
+'''
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from aiotomon.codec import available  # noqa: E402
+
+N = 2000
+
+
+def _user(i):
+    return {'id': str(156676532616687616 + i), 'username': f'user{i}',
+            'discriminator': f'{i % 10000:04d}', 'avatar': None,
+            'avatar_url': f'https://cdn.tomon.co/avatars/{i}.png', 'type': 1}
+
+
+def _synthetic_frames():
+    message = {'op': 0, 'e': 'MESSAGE_CREATE', 'd': {
+        'id': '163422190513131520', 'channel_id': '156676532616687616',
+        'author': _user(1), 'type': 0, 'content': '你好，Hello World !',
+        'timestamp': '2020-08-16T09:00:00.000Z', 'nonce': '1597568400000',
+        'attachments': [], 'mentions': [], 'stamps': [], 'reactions': []}}
+    presence = {'op': 0, 'e': 'USER_PRESENCE_UPDATE',
+                'd': {'user': _user(2), 'status': 'online'}}
+    typing = {'op': 0, 'e': 'USER_TYPING',
+              'd': {'channel_id': '156676532616687616', 'user_id': '1'}}
+    guild = {'op': 0, 'e': 'GUILD_CREATE', 'd': {
+        'id': '156676532616687615', 'name': 'guild', 'owner_id': '1',
+        'channels': [{'id': str(i), 'name': f'channel{i}', 'type': 0,
+                      'position': i} for i in range(50)],
+        'roles': [{'id': str(i), 'name': f'role{i}', 'permissions': 0}
+                  for i in range(20)],
+        'members': [{'user': _user(i), 'nick': None, 'roles': ['1', '2'],
+                     'joined_at': '2020-08-16T09:00:00.000Z'}
+                    for i in range(1000)]}}
+    return {name: json.dumps(frame, ensure_ascii=False).encode()
+            for name, frame in [('MESSAGE_CREATE', message),
+                                ('USER_PRESENCE_UPDATE', presence),
+                                ('USER_TYPING', typing),
+                                ('GUILD_CREATE', guild)]}
+
+
+def _recorded_frames(path):
+    frames = {}
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                name = json.loads(line).get('e') or 'op'
+                frames.setdefault(name, line)
+    return frames
+
+
+def main() -> None:
+    frames = _recorded_frames(sys.argv[1]) if len(sys.argv) > 1 else _synthetic_frames()
+    codecs = available()
+    print(f'{"frame":<24}{"bytes":>10}' + ''.join(f'{name:>12}' for name in codecs))
+    for name, frame in frames.items():
+        n = max(10, N * 1000 // len(frame))
+        costs = []
+        for codec in codecs.values():
+            begin = time.perf_counter()
+            for _ in range(n):
+                codec.loads(frame)
+            costs.append((time.perf_counter() - begin) / n * 1e6)
+        print(f'{name:<24}{len(frame):>10}' + ''.join(f'{c:>9.2f} us' for c in costs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+'''
+Micro-benchmark of action dispatch overhead per call
+
+The network is stubbed out, only the action resolution is measured:
+
+    python benchmark/dispatch.py
+'''
+
+import asyncio
+import functools
+import os
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from aiotomon import Tomon  # noqa: E402
+from aiotomon.api_func import ChannelApi  # noqa: E402
+from aiotomon.config import Channel  # noqa: E402
+from aiotomon.exceptions import NetworkError  # noqa: E402
+
+N = 100000
+
+
+async def _fake_request(url_path, **params):
+    return None
+
+
+def _stub(bot: Tomon) -> None:
+    api = bot._api
+    api._get_data = _fake_request
+    api._action_general = _fake_request
+
+
+async def _legacy_call_action(api, action, **kwargs):
+    '''
+    The call_action of the legacy mapping, error handling included
+    '''
+    mapping = {
+        ChannelApi.login: api._action_login,
+        ChannelApi.send_image: api._action_send_image,
+        ChannelApi.send_text: functools.partial(
+            api._action_general,
+            Channel.SEND_TEXT.format(channelId=kwargs.get('cid'))),
+        ChannelApi.get_user_info: functools.partial(
+            api._get_data, Channel.GET_USER_INFO),
+        ChannelApi.get_channel_user_info: functools.partial(
+            api._get_data,
+            Channel.GET_CHANNEL_USER_INFO.format(guildId=kwargs.get('gid'),
+                                                 userId=kwargs.get('uid')))
+    }
+    try:
+        return await mapping[action](**kwargs)
+    except aiohttp.InvalidURL:
+        raise NetworkError('Api parsing error, please check the root URL')
+    except aiohttp.ClientError:
+        raise NetworkError('aiohttp connection error')
+
+
+async def _bench(name, call) -> None:
+    begin = time.perf_counter()
+    for _ in range(N):
+        await call()
+    cost = (time.perf_counter() - begin) / N * 1e6
+    print(f'{name:<32}{cost:8.3f} us/call')
+
+
+async def main() -> None:
+    bot = Tomon()
+    _stub(bot)
+    api = bot._api
+
+    await _bench('legacy mapping (send_text)',
+                 lambda: _legacy_call_action(api, 'send_text', cid='1', content='hi'))
+    await _bench('route table (send_text)',
+                 lambda: api.call_action('send_text', cid='1', content='hi'))
+    await _bench('bot.send_text',
+                 lambda: bot.send_text(cid='1', content='hi'))
+    await _bench('route table (get_channel_user)',
+                 lambda: api.call_action('get_channel_user_info', gid='1', uid='2'))
+
+    await api.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
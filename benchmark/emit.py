@@ -0,0 +1,86 @@
+'''
+Micro-benchmark of EventQueue.emit for deep event names with many subscribers
+
+    python benchmark/emit.py
+'''
+
+import asyncio
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from aiotomon.event import EventQueue, run_async_funcs  # noqa: E402
+
+N = 20000
+
+EVENT = 'message.channel.create.text.plain'
+
+SUBSCRIBERS = 10
+
+
+class LegacyEventQueue:
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._hooks_before = defaultdict(set)
+
+    def subscribe(self, event, func):
+        self._subscribers[event].add(func)
+
+    def hook_before(self, event, func):
+        self._hooks_before[event].add(func)
+
+    async def emit(self, event, *args, **kwargs):
+        event_copy = event
+
+        while True:
+            await run_async_funcs(self._hooks_before[event], *args, **kwargs)
+            event, *sub_event = event.rsplit('.', maxsplit=1)
+            if not sub_event:
+                break
+        event = event_copy
+
+        results = []
+        while True:
+            results += await run_async_funcs(self._subscribers[event],
+                                             *args, **kwargs)
+            event, *sub_event = event.rsplit('.', maxsplit=1)
+            if not sub_event:
+                break
+        return results
+
+
+def _fill(queue) -> None:
+    parts = EVENT.split('.')
+    for i in range(1, len(parts) + 1):
+        name = '.'.join(parts[:i])
+        for _ in range(SUBSCRIBERS):
+            async def handler(ctx):
+                return None
+            queue.subscribe(name, handler)
+        async def hook(ctx):
+            return None
+        queue.hook_before(name, hook)
+
+
+async def _bench(name, queue) -> None:
+    _fill(queue)
+    ctx = {}
+    begin = time.perf_counter()
+    for _ in range(N):
+        await queue.emit(EVENT, ctx)
+    cost = (time.perf_counter() - begin) / N * 1e6
+    print(f'{name:<12}{cost:8.2f} us/emit')
+
+
+async def main() -> None:
+    print(f'{EVENT}, {SUBSCRIBERS} subscribers and 1 hook per level')
+    await _bench('legacy', LegacyEventQueue())
+    await _bench('resolved', EventQueue())
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,24 @@
+import aiotomon
+from aiotomon.shard import ShardRunner
+
+import config
+
+
+def create_bot():
+    # 每个分片进程各自初始化 bot 并加载插件
+    aiotomon.init(config)
+
+    bot = aiotomon.get_bot()
+
+    bot.auto_load_plugin()
+
+    return bot
+
+
+def main():
+
+    ShardRunner(create_bot, shards=2).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -20,10 +20,10 @@ setup(
     install_requires=[
         'aiofiles >= 0.4.0', 
         'aiohttp >= 3.6.2', 
-        'websockets >= 8.1'
+        'websockets >= 10.0'
         ],
     extras_require={
-        'all': ['ujson'],
+        'all': ['orjson', 'ujson'],
     },
     python_requires='>=3.7',
     platforms='any',